@@ -0,0 +1,190 @@
+"""
+Compares the article extraction of generate-documents with the original DOM-based algorithm,
+which built a parent map of the whole body, searched nested levels below every level and
+extracted text recursively. Every parser backend must produce records identical to it.
+"""
+import argparse
+import functools
+import glob
+import logging
+import os
+import random
+import tempfile
+import time
+from typing import Callable, Dict, List
+import xml.etree.ElementTree as ET
+
+from generate_documents import NAMESPACES, PARSERS, get_full_text, load_articles, lxml_etree, single_line
+from helpers import setup_logging_levels
+from synthetic_corpus import CorpusProfile, Templates, synthetic_document
+
+
+def reference_full_text(element: ET.Element) -> str:
+    texts = []
+    if element is None:
+        return ""
+
+    if element.text and element.text.strip():
+        texts.append(element.text.strip())
+
+    for child in element:
+        texts.append(reference_full_text(child))
+        if child.tail and child.tail.strip():
+            texts.append(child.tail.strip())
+
+    return ' '.join(texts)
+
+
+def reference_load_articles(document_path: str) -> List[Dict[str, str]]:
+    ns = NAMESPACES
+    root = ET.parse(document_path).getroot()
+    meta_data = root.find('akn:act/akn:meta/akn:identification', ns)
+    dates = {
+        "document": meta_data.find("akn:FRBRWork/akn:FRBRdate[@name='jolux:dateDocument']", ns).get('date'),
+        "entry_in_force": meta_data.find("akn:FRBRWork/akn:FRBRdate[@name='jolux:dateEntryInForce']", ns).get('date'),
+        "applicability": meta_data.find("akn:FRBRWork/akn:FRBRdate[@name='jolux:dateApplicability']", ns).get('date')
+    }
+    doc_title_element = root.find('akn:act/akn:preface/akn:p/akn:docTitle', ns)
+    doc_title = single_line(reference_full_text(doc_title_element) if doc_title_element is not None else "Unknown Title")
+
+    def with_parents(body: ET.Element, items: List[ET.Element]):
+        element_map = {child: parent for parent in body.iter() for child in parent}
+        for item in items:
+            path = []
+            element = item
+            while element is not None:
+                path.append(element)
+                element = element_map.get(element)
+            yield item, path[::-1]
+
+    def extract_items(items_with_parents) -> List[Dict[str, str]]:
+        items = []
+        for item, parent_chain in items_with_parents:
+            hierarchy = [reference_full_text(p.find("akn:num", ns)) + " " + reference_full_text(p.find("akn:heading", ns))
+                         for p in parent_chain]
+            item_with_context = {
+                "doc_title": doc_title,
+                "doc_date": dates["document"],
+                "entry_in_force": dates["entry_in_force"],
+                "applicability": dates["applicability"],
+                "hierarchy": single_line(" / ".join(hierarchy)),
+                "article_number": reference_full_text(item.find("akn:num", ns)) or "",
+                "article_text": reference_full_text(item)
+            }
+            if item_with_context["article_text"]:
+                items.append(item_with_context)
+        return items
+
+    body = root.find("akn:act/akn:body", ns)
+    if body is None:
+        return []
+
+    extracted = extract_items(with_parents(body, body.findall(".//akn:article", ns)))
+    if len(extracted) == 0:
+        last_levels = [level for level in body.findall(".//akn:level", ns) if not level.findall(".//akn:level", ns)]
+        extracted = extract_items(with_parents(body, last_levels))
+        if len(extracted) == 0:
+            extracted = [{
+                "doc_title": doc_title,
+                "doc_date": dates["document"],
+                "entry_in_force": dates["entry_in_force"],
+                "applicability": dates["applicability"],
+                "hierarchy": "N/A",
+                "article_number": "N/A",
+                "article_text": reference_full_text(root)
+            }]
+
+    return extracted
+
+
+def nested_articles_document(templates: Templates, count: int = 50) -> str:
+    """Builds a document whose articles each contain a nested article, itself containing another one,
+    with paragraphs before and after them, so that inner articles close before their enclosing one."""
+    rng = random.Random(0)
+    header, footer = templates.frames[0]
+
+    def article(number: str, inner: str) -> str:
+        sentences = [rng.choice(templates.sentences) for _ in range(2)]
+        return (f'<article eId="art_{number}"><num><b>Art. {number}</b></num><heading>{sentences[0][:60]}</heading>'
+                f'<paragraph><num>1</num><content><p>{sentences[0]}</p></content></paragraph>{inner}'
+                f'<paragraph><num>2</num><content><p>{sentences[1]}</p></content></paragraph></article>')
+
+    articles = "".join(article(str(index), article(f"{index}a", article(f"{index}a-i", ""))) for index in range(1, count + 1))
+    return header + f'<chapter eId="chap_1"><num>Chapitre 1</num>{articles}</chapter>' + footer
+
+
+def best_time(function: Callable, argument, repeat: int) -> float:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function(argument)
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def main():
+
+    setup_logging_levels()
+
+    usage = """Benchmarking article extraction against the original algorithm."""
+    parser = argparse.ArgumentParser(description=usage,
+                                     formatter_class=argparse.ArgumentDefaultsHelpFormatter
+                                     )
+    parser.add_argument('-r', '--repeat', type=int, help='Number of timed runs per document (best is kept)', default=3)
+    parser.add_argument('-n', '--articles', type=int, help='Number of articles in synthetic documents', default=2000)
+    parser.add_argument('-d', '--depth', type=int, help='Nesting depth of synthetic documents', default=6)
+    parser.add_argument('-p', '--parsers', nargs="+", choices=list(PARSERS), help='Parser backends to compare',
+                        default=[name for name in PARSERS if name != "lxml" or lxml_etree is not None])
+    parser.add_argument("resources", type=str, nargs="?", default="resources", help="Folder with sample fedlex-*.xml documents")
+    args = parser.parse_args()
+
+    # extraction logs every document
+    logging.getLogger().setLevel(logging.WARNING)
+
+    templates = Templates(args.resources)
+    profiles = [CorpusProfile(name, count_files=1, count_items=args.articles, depth=args.depth, paragraphs=4,
+                              sentences=2, with_articles=with_articles)
+                for name, with_articles in (("synthetic-articles", True), ("synthetic-levels", False))]
+    with tempfile.TemporaryDirectory() as temp_dir:
+        documents = sorted(glob.glob(os.path.join(args.resources, "fedlex-*.xml")))
+        for profile in profiles:
+            document = os.path.join(temp_dir, f"{profile.name}.xml")
+            with open(document, "w", encoding="utf-8") as f:
+                f.write(synthetic_document(templates, profile))
+            documents.append(document)
+
+        # nested articles must come in document order, enclosing articles first
+        document = os.path.join(temp_dir, "synthetic-nested-articles.xml")
+        with open(document, "w", encoding="utf-8") as f:
+            f.write(nested_articles_document(templates))
+        documents.append(document)
+
+        print(f"{'document':<60} {'items':>7} {'reference (s)':>14}" + "".join(f" {name + ' (s)':>12} {'speedup':>8}" for name in args.parsers))
+        totals = {name: 0. for name in ["reference"] + args.parsers}
+        for document in documents:
+            expected = reference_load_articles(document)
+            reference = best_time(reference_load_articles, document, args.repeat)
+            totals["reference"] += reference
+            row = f"{os.path.basename(document):<60} {len(expected):>7} {reference:>14.4f}"
+            for name in args.parsers:
+                load = functools.partial(load_articles, parser=name)
+                if load(document) != expected:
+                    raise RuntimeError(f"records extracted by {name} parser differ from reference for {document}")
+
+                current = best_time(load, document, args.repeat)
+                totals[name] += current
+                row += f" {current:>12.4f} {reference / current:>7.1f}x"
+            print(row)
+
+        print(f"{'total':<60} {'':>7} {totals['reference']:>14.4f}"
+              + "".join(f" {totals[name]:>12.4f} {totals['reference'] / totals[name]:>7.1f}x" for name in args.parsers))
+
+    root = ET.fromstring(synthetic_document(templates, profiles[0]))
+    reference = best_time(reference_full_text, root, args.repeat)
+    current = best_time(get_full_text, root, args.repeat)
+    print(f"{'full text of synthetic document':<60} {'':>7} {reference:>14.4f} {current:>12.4f} {reference / current:>7.1f}x")
+    print("all parsers produced records identical to the reference")
+
+
+if __name__ == "__main__":
+    main()
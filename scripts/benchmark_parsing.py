@@ -0,0 +1,141 @@
+"""
+Measures the generate-documents pipeline on synthetic corpora, without the real Fedlex download.
+
+Each scenario runs in a fresh process so that its peak RSS is measured in isolation. Time spent in
+article extraction, formatting, serialization and the compressed jsonl writer is reported separately.
+"""
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+import gzip
+import io
+import json
+import logging
+import multiprocessing
+import os
+import resource
+import sys
+import tempfile
+import time
+from typing import Dict, List
+
+from generate_documents import PARSERS, format_chunks, list_all_files, load_articles, to_json_lines
+from helpers import setup_logging_levels
+from synthetic_corpus import PROFILES, Templates, generate_corpus
+
+
+STAGES = ["load_articles", "format_chunks", "to_json_lines", "jsonl_writer"]
+
+
+def run_scenario(corpus_folder: str, parser: str) -> Dict[str, float]:
+    """Builds the documents file of a corpus, timing each stage."""
+    logging.getLogger().setLevel(logging.WARNING)
+    documents = sorted(list_all_files(corpus_folder))
+    timings = {stage: 0. for stage in STAGES}
+    count_articles = 0
+    start = time.perf_counter()
+    with tempfile.TemporaryDirectory() as temp_dir:
+        with gzip.GzipFile(os.path.join(temp_dir, "law_articles.jsonl.gz"), "wb", mtime=0) as gzip_file, \
+                io.TextIOWrapper(gzip_file, encoding="utf-8") as out_file:
+            for document in documents:
+                checkpoint = time.perf_counter()
+                structured_articles = load_articles(document, parser)
+                timings["load_articles"] += time.perf_counter() - checkpoint
+
+                checkpoint = time.perf_counter()
+                articles = format_chunks(structured_articles)
+                timings["format_chunks"] += time.perf_counter() - checkpoint
+                if not articles:
+                    continue
+
+                checkpoint = time.perf_counter()
+                lines = to_json_lines(document, corpus_folder, structured_articles, articles)
+                timings["to_json_lines"] += time.perf_counter() - checkpoint
+
+                checkpoint = time.perf_counter()
+                out_file.writelines(lines)
+                timings["jsonl_writer"] += time.perf_counter() - checkpoint
+                count_articles += len(lines)
+
+    elapsed = time.perf_counter() - start
+    # kilobytes on Linux, bytes on macOS
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * (1 if sys.platform == "darwin" else 1024)
+    return {
+        "files": len(documents),
+        "articles": count_articles,
+        "seconds": elapsed,
+        "files_per_second": len(documents) / elapsed,
+        "articles_per_second": count_articles / elapsed,
+        "peak_rss_mb": peak_rss / 2 ** 20,
+        **{f"{stage}_seconds": timings[stage] for stage in STAGES}
+    }
+
+
+def check_regressions(results: Dict[str, Dict[str, float]], baseline_file: str, tolerance: float) -> List[str]:
+    with open(baseline_file, "r") as f:
+        baseline = json.load(f)
+
+    regressions = []
+    for scenario, metrics in results.items():
+        if scenario not in baseline:
+            continue
+        for metric, higher_is_better in (("articles_per_second", True), ("peak_rss_mb", False)):
+            previous, current = baseline[scenario][metric], metrics[metric]
+            ratio = current / previous if higher_is_better else previous / current
+            if ratio < 1 - tolerance:
+                regressions.append(f"{scenario}: {metric} {previous:.1f} -> {current:.1f}")
+
+    return regressions
+
+
+def main():
+
+    setup_logging_levels()
+
+    usage = """Benchmarking document generation on synthetic corpora."""
+    parser = argparse.ArgumentParser(description=usage,
+                                     formatter_class=argparse.ArgumentDefaultsHelpFormatter
+                                     )
+    parser.add_argument('-s', '--scenarios', nargs="+", choices=list(PROFILES), help='Corpus profiles to run', default=list(PROFILES))
+    parser.add_argument('--scale', type=float, help='Multiplier applied to the number of files of each profile', default=1.)
+    parser.add_argument('-p', '--parser', choices=list(PARSERS), help='XML parser backend', default="etree")
+    parser.add_argument('-r', '--resources', type=str, help='Folder with akomantoso30.xsd and sample fedlex-*.xml documents', default="resources")
+    parser.add_argument('-o', '--output', type=str, help='Saves results as json, for later comparison')
+    parser.add_argument('-b', '--baseline', type=str, help='Results of a previous run: exits with an error on regressions')
+    parser.add_argument('-t', '--tolerance', type=float, help='Accepted relative degradation against the baseline', default=0.1)
+    args = parser.parse_args()
+
+    templates = Templates(args.resources)
+    results = {}
+    print(f"{'scenario':<16} {'files':>6} {'articles':>9} {'files/s':>9} {'articles/s':>11} {'peak RSS (MB)':>14}"
+          + "".join(f" {stage + ' (s)':>18}" for stage in STAGES))
+    with tempfile.TemporaryDirectory() as temp_dir:
+        for scenario in args.scenarios:
+            profile = PROFILES[scenario]
+            profile = profile._replace(count_files=max(1, int(profile.count_files * args.scale)))
+            corpus_folder = os.path.join(temp_dir, scenario)
+            generate_corpus(templates, profile, corpus_folder)
+
+            # a fresh process per scenario keeps peak memory measurements independent, spawned rather than
+            # forked so that its peak RSS does not start from the memory of this process
+            with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn")) as executor:
+                metrics = executor.submit(run_scenario, corpus_folder, args.parser).result()
+
+            results[scenario] = metrics
+            print(f"{scenario:<16} {metrics['files']:>6} {metrics['articles']:>9} {metrics['files_per_second']:>9.1f} "
+                  f"{metrics['articles_per_second']:>11.1f} {metrics['peak_rss_mb']:>14.1f}"
+                  + "".join(f" {metrics[stage + '_seconds']:>18.3f}" for stage in STAGES))
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=3)
+
+    if args.baseline:
+        regressions = check_regressions(results, args.baseline, args.tolerance)
+        for regression in regressions:
+            logging.error("regression: %s", regression)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+"""
+Measures Chroma HNSW settings on stored vectors against exact search, to choose the settings of import-db.
+
+Sampled vectors are held out as queries and the others indexed once per combination of settings. Each
+index is scored by recall@k against the exact neighbours given by ExactSearchIndex, by the latency of
+single queries, by its build time and by its size on disk. A result counts as found when it is not farther
+than the k-th exact neighbour, so that identical vectors (e.g. of near-duplicate articles) are interchangeable.
+"""
+import argparse
+import itertools
+import json
+import logging
+import os
+import tempfile
+import time
+from typing import Dict, List, Optional
+
+import chromadb
+import numpy as np
+
+from exact_search import METRICS, ExactSearchIndex, recall
+from helpers import setup_logging_levels
+from import_vector_db import hnsw_metadata
+from vector_dataset import VectorDataset, is_dataset, iter_records
+
+
+def load_embeddings(path: str, limit: Optional[int] = None) -> np.ndarray:
+    """Embeddings of a binary dataset folder (memory mapped) or of a vectors jsonl file, up to `limit` rows."""
+    if is_dataset(path):
+        return VectorDataset(path).embeddings[:limit]
+    records = itertools.islice(iter_records(path), limit)
+    return np.asarray([record.embedding for record in records], dtype=np.float32)
+
+
+def directory_size(path: str) -> int:
+    return sum(os.path.getsize(os.path.join(folder, name)) for folder, _, names in os.walk(path) for name in names)
+
+
+def run_setting(embeddings: np.ndarray, queries: np.ndarray, exact_distances: np.ndarray, k: int, metadata: Dict,
+                batch_size: int = 5000) -> Dict[str, float]:
+    """Builds a Chroma collection with `metadata` in a temporary folder, then queries it one query at a time.
+
+    The size on disk is measured once the client is stopped, the index included.
+    """
+    with tempfile.TemporaryDirectory() as temp_dir:
+        db_client = chromadb.PersistentClient(
+            path=temp_dir,
+            settings=chromadb.config.Settings(anonymized_telemetry=False),
+            tenant=chromadb.config.DEFAULT_TENANT,
+            database=chromadb.config.DEFAULT_DATABASE,
+        )
+        vectordb = db_client.create_collection(name="benchmark", metadata=metadata)
+
+        start = time.perf_counter()
+        for position in range(0, len(embeddings), batch_size):
+            block = np.asarray(embeddings[position:position + batch_size], dtype=np.float32)
+            vectordb.add(ids=[str(row) for row in range(position, position + len(block))], embeddings=block)
+        build_seconds = time.perf_counter() - start
+
+        latencies = []
+        distances = []
+        for query in queries:
+            start = time.perf_counter()
+            matches = vectordb.query(query_embeddings=query[None, :], n_results=k, include=["distances"])
+            latencies.append(time.perf_counter() - start)
+            distances.append(matches["distances"][0])
+
+        # stopping the client persists the HNSW segment, which is otherwise only written every
+        # hnsw:sync_threshold additions; rows added since are still counted in the log of chroma.sqlite3
+        db_client.clear_system_cache()
+        size = directory_size(temp_dir)
+
+    return {
+        "recall": recall(np.asarray(distances), exact_distances),
+        "p50_ms": float(np.percentile(latencies, 50)) * 1000,
+        "p99_ms": float(np.percentile(latencies, 99)) * 1000,
+        "build_seconds": build_seconds,
+        "disk_mb": size / 2 ** 20,
+    }
+
+
+def main():
+
+    setup_logging_levels()
+
+    usage = """Benchmarking recall and latency of Chroma HNSW settings against exact search."""
+    parser = argparse.ArgumentParser(description=usage,
+                                     formatter_class=argparse.ArgumentDefaultsHelpFormatter
+                                     )
+    parser.add_argument('-d', '--distance', choices=METRICS, help='Distance function', default="cosine")
+    parser.add_argument('--M', type=int, nargs="+", dest="m", help='Values of the maximum number of neighbours per node', default=[16])
+    parser.add_argument('--construction-ef', type=int, nargs="+", help='Values of the candidate list size when building', default=[100])
+    parser.add_argument('--search-ef', type=int, nargs="+", help='Values of the candidate list size when searching', default=[10, 50, 100])
+    parser.add_argument('-k', '--top-k', type=int, help='Number of neighbours compared', default=10)
+    parser.add_argument('-q', '--queries', type=int, help='Number of vectors held out as queries', default=500)
+    parser.add_argument('-l', '--limit', type=int, help='Number of vectors read, all by default')
+    parser.add_argument('--seed', type=int, help='Seed of the sampling of queries', default=0)
+    parser.add_argument('-o', '--output', type=str, help='Saves results as json')
+    parser.add_argument("vectors", type=str, help="Vectors as jsonl file (may be gzipped) or binary dataset folder")
+    args = parser.parse_args()
+
+    embeddings = load_embeddings(args.vectors, args.limit)
+    held_out = np.zeros(len(embeddings), dtype=bool)
+    held_out[np.random.default_rng(args.seed).choice(len(embeddings), size=args.queries, replace=False)] = True
+    queries = np.asarray(embeddings[held_out], dtype=np.float32)
+    indexed = np.asarray(embeddings[~held_out], dtype=np.float32)
+    logging.info("indexing %d vectors of dimension %d, %d queries", *indexed.shape, len(queries))
+
+    start = time.perf_counter()
+    _, distances = ExactSearchIndex(indexed, args.distance).search(queries, args.top_k)
+    logging.info("exact neighbours found in %.1f s", time.perf_counter() - start)
+
+    results: List[Dict] = []
+    print(f"{'M':>4} {'construction_ef':>16} {'search_ef':>10} {f'recall@{args.top_k}':>10} {'p50 (ms)':>9} "
+          f"{'p99 (ms)':>9} {'build (s)':>10} {'disk (MB)':>10}")
+    for m, construction_ef, search_ef in itertools.product(args.m, args.construction_ef, args.search_ef):
+        metadata = hnsw_metadata(args.distance, m, construction_ef, search_ef)
+        metrics = run_setting(indexed, queries, distances, args.top_k, metadata)
+        results.append({"M": m, "construction_ef": construction_ef, "search_ef": search_ef, **metrics})
+        print(f"{m:>4} {construction_ef:>16} {search_ef:>10} {metrics['recall']:>10.4f} {metrics['p50_ms']:>9.2f} "
+              f"{metrics['p99_ms']:>9.2f} {metrics['build_seconds']:>10.1f} {metrics['disk_mb']:>10.1f}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=3)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+"""
+Builds a quantized index over the vectors of a binary dataset folder, for search-db --engine quantized.
+
+The index is evaluated on vectors of the dataset sampled as queries: recall@k against exact search
+and query latency of both, and memory held by the codes against the float32 vectors.
+"""
+import argparse
+import logging
+import time
+
+import numpy as np
+
+from exact_search import METRICS, ExactSearchIndex, recall
+from helpers import setup_logging_levels
+from quantized_index import METHODS, QuantizedIndex
+from vector_dataset import VectorDataset, is_dataset
+
+
+def main():
+
+    setup_logging_levels()
+
+    usage = """Building a compressed index over the vectors of a binary dataset, searched with exact re-ranking."""
+    parser = argparse.ArgumentParser(description=usage,
+                                     formatter_class=argparse.ArgumentDefaultsHelpFormatter
+                                     )
+    parser.add_argument('-m', '--method', choices=METHODS, help='Scalar quantization (1 byte per dimension) or product quantization (1 byte per subspace)', default="sq")
+    parser.add_argument('-d', '--distance', choices=METRICS, help='Distance function', default="cosine")
+    parser.add_argument('-s', '--subspaces', type=int, help='Number of subspaces of product quantization, dividing the dimension', default=256)
+    parser.add_argument('--train-size', type=int, help='Number of vectors sampled for fitting the quantizer', default=20000)
+    parser.add_argument('-q', '--queries', type=int, help='Number of vectors sampled as queries for evaluation', default=200)
+    parser.add_argument('-k', '--top-k', type=int, help='Number of neighbours compared', default=10)
+    parser.add_argument('-c', '--candidates', type=int, help='Candidates of the approximate pass ranked exactly', default=100)
+    parser.add_argument("dataset", type=str, help="Binary dataset folder (see convert-vectors)")
+    parser.add_argument("index", type=str, help="Folder where the index is saved")
+    args = parser.parse_args()
+
+    if not is_dataset(args.dataset):
+        parser.error(f"{args.dataset} is not a binary dataset folder, see convert-vectors")
+
+    dataset = VectorDataset(args.dataset)
+    start = time.perf_counter()
+    index = QuantizedIndex.build(dataset.embeddings, args.method, args.distance, args.subspaces, args.train_size)
+    index.save(args.index)
+    logging.info("indexed %d vectors in %.1f s, saved to %s", len(index), time.perf_counter() - start, args.index)
+
+    queries = np.asarray(dataset.embeddings[np.random.default_rng(0).choice(len(index), min(args.queries, len(index)),
+                                                                           replace=False)])
+    exact = ExactSearchIndex(dataset.embeddings, args.distance)
+    exact.search(queries[:1], args.top_k)  # row norms are computed by the first search
+    timings = {}
+    for name, search in (("exact", lambda query: exact.search(query, args.top_k)),
+                         ("quantized", lambda query: index.search(query, args.top_k, args.candidates))):
+        distances = []
+        latencies = []
+        for query in queries:
+            start = time.perf_counter()
+            distances.append(search(query)[1][0])
+            latencies.append(time.perf_counter() - start)
+        timings[name] = (np.asarray(distances), np.percentile(latencies, 50) * 1000, np.percentile(latencies, 99) * 1000)
+
+    codes_mb, vectors_mb = index.codes.nbytes / 2 ** 20, dataset.embeddings.nbytes / 2 ** 20
+    print(f"memory: {codes_mb:.1f} MB of codes instead of {vectors_mb:.1f} MB of vectors ({vectors_mb / codes_mb:.0f}x smaller)")
+    print(f"recall@{args.top_k} with {args.candidates} candidates: {recall(timings['quantized'][0], timings['exact'][0]):.4f}")
+    for name, (_, p50, p99) in timings.items():
+        print(f"{name} search latency: p50 {p50:.2f} ms, p99 {p99:.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
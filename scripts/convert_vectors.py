@@ -0,0 +1,49 @@
+"""
+Converts vectors between the jsonl format of generate-vectors and the binary dataset format, in either direction.
+"""
+import argparse
+import gzip
+import logging
+
+from helpers import setup_logging_levels
+from vector_dataset import VectorDatasetWriter, is_dataset, iter_batches, iter_records, jsonl_line
+
+
+def to_dataset(jsonl_path: str, folder: str, batch_size: int = 1000) -> int:
+    with VectorDatasetWriter(folder) as writer:
+        for ids, embeddings, documents, metadatas in iter_batches(jsonl_path, batch_size):
+            writer.write_many(ids, embeddings, documents, metadatas)
+    return writer.count
+
+
+def to_jsonl(folder: str, jsonl_path: str) -> int:
+    count = 0
+    open_func = gzip.open if jsonl_path.endswith(".gz") else open
+    with open_func(jsonl_path, "wt", encoding="utf-8") as f:
+        for record in iter_records(folder):
+            f.write(jsonl_line(record))
+            count += 1
+    return count
+
+
+def main():
+
+    setup_logging_levels()
+
+    usage = """Converting vectors from jsonl to a binary dataset folder, or from a binary dataset folder to jsonl."""
+    parser = argparse.ArgumentParser(description=usage,
+                                     formatter_class=argparse.ArgumentDefaultsHelpFormatter
+                                     )
+    parser.add_argument("source", type=str, help="Vectors jsonl file (may be gzipped) or binary dataset folder")
+    parser.add_argument("target", type=str, help="Binary dataset folder, or jsonl file (gzipped if ending with .gz) when converting a dataset")
+    args = parser.parse_args()
+
+    if is_dataset(args.source):
+        count = to_jsonl(args.source, args.target)
+    else:
+        count = to_dataset(args.source, args.target)
+    logging.info("converted %d vectors from %s to %s", count, args.source, args.target)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+"""
+Finds near-duplicate articles in the documents file of generate-documents, such as versions of an article
+differing only by spacing or footnote numbering, or repeated boilerplate like repealed articles.
+
+Each article similar enough to an earlier one is mapped to it, so that generate-vectors --duplicates
+reuses the vector of that representative instead of embedding the article again.
+"""
+import argparse
+import json
+import logging
+import os
+
+from embedding_engine import MAX_TOKENS_PER_REQUEST, estimate_tokens, pack_batches
+from helpers import iter_jsonl, setup_logging_levels
+from near_duplicates import NearDuplicateIndex
+
+
+def main():
+
+    setup_logging_levels()
+
+    usage = """Mapping near-duplicate articles to a representative, for embedding only one of them."""
+    parser = argparse.ArgumentParser(description=usage,
+                                     formatter_class=argparse.ArgumentDefaultsHelpFormatter
+                                     )
+    parser.add_argument('-t', '--threshold', type=float, help='Minimum estimated Jaccard similarity of word shingles', default=0.9)
+    parser.add_argument('-p', '--permutations', type=int, help='Size of MinHash signatures', default=128)
+    parser.add_argument('-s', '--shingle-size', type=int, help='Number of words per shingle', default=3)
+    parser.add_argument('-b', '--batch-size', type=int, help='Maximum number of documents per request, for estimating requests saved', default=128)
+    parser.add_argument("documents_file", type=str, help="Documents file as .jsonl (may be gzipped)")
+    parser.add_argument("output_dir", type=str, help="Directory where law_articles.duplicates.jsonl is saved")
+    args = parser.parse_args()
+
+    index = NearDuplicateIndex(args.threshold, args.permutations, args.shingle_size)
+    logging.info("comparing %d bands of %d rows", index.bands, index.rows)
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    duplicates_file = os.path.join(args.output_dir, "law_articles.duplicates.jsonl")
+    seen_uids = set()
+    count_documents = 0
+    saved_tokens = []
+    with open(duplicates_file, "w", encoding="utf-8") as f:
+        for document in iter_jsonl(args.documents_file):
+            count_documents += 1
+            # identical articles already share their uid
+            if document["uid"] in seen_uids:
+                continue
+            seen_uids.add(document["uid"])
+
+            duplicate = index.add(document["uid"], document["text"])
+            if duplicate is not None:
+                f.write(json.dumps(duplicate._asdict()) + "\n")
+                saved_tokens.append(estimate_tokens(document["text"]))
+
+            if count_documents % 10000 == 0:
+                logging.info("processed %d documents, %d near-duplicates", count_documents, len(saved_tokens))
+
+    report = {
+        "documents": count_documents,
+        "distinct_uids": len(seen_uids),
+        "representatives": index.count_representatives,
+        "near_duplicates": len(saved_tokens),
+        "requests_saved": len(pack_batches(saved_tokens, MAX_TOKENS_PER_REQUEST, args.batch_size)),
+    }
+    with open(os.path.join(args.output_dir, "law_articles.duplicates.report.json"), "w") as f:
+        json.dump(report, f, indent=3)
+
+    logging.info("%d near-duplicates of %d distinct articles mapped to their representative in %s",
+                 report["near_duplicates"], report["distinct_uids"], duplicates_file)
+    logging.info("embedding them separately would take about %d requests", report["requests_saved"])
+
+
+if __name__ == "__main__":
+    main()
@@ -1,19 +1,64 @@
 import argparse
+import gzip
 import json
+import logging
+from typing import Dict, Iterator, List, Optional, Tuple
 
 import chromadb
 
 from helpers import setup_logging_levels
+from vector_dataset import VectorDatasetWriter, VectorRecord, jsonl_line
+
+
+def iter_pages(vectordb: chromadb.Collection, page_size: int, where: Optional[Dict] = None,
+               where_document: Optional[Dict] = None) -> Iterator[Tuple[List[str], List, List[str], List[Dict]]]:
+    """(ids, embeddings, documents, metadatas) of the entries matching the filters, `page_size` at a time.
+
+    Only one page is held in memory. The collection must not be written to meanwhile, pages being read by offset.
+    """
+    offset = 0
+    while True:
+        page = vectordb.get(where=where, where_document=where_document, limit=page_size, offset=offset,
+                            include=["embeddings", "documents", "metadatas"])
+        if not page["ids"]:
+            return
+        yield page["ids"], page["embeddings"], page["documents"], page["metadatas"]
+        offset += len(page["ids"])
+
+
+def export_binary(pages: Iterator[Tuple[List[str], List, List[str], List[Dict]]], folder: str) -> int:
+    with VectorDatasetWriter(folder) as writer:
+        for ids, embeddings, documents, metadatas in pages:
+            writer.write_many(ids, embeddings, documents, metadatas)
+            logging.info("exported %d entries", writer.count)
+    return writer.count
+
+
+def export_jsonl(pages: Iterator[Tuple[List[str], List, List[str], List[Dict]]], file_path: str) -> int:
+    count = 0
+    open_func = gzip.open if file_path.endswith(".gz") else open
+    with open_func(file_path, "wt", encoding="utf-8") as f:
+        for page in pages:
+            for record in map(VectorRecord._make, zip(*page)):
+                f.write(jsonl_line(record))
+            count += len(page[0])
+            logging.info("exported %d entries", count)
+    return count
 
 
 def main():
 
     setup_logging_levels()
 
-    usage = """Exporting current entries."""
+    usage = """Exporting current entries, as jsonl or as binary dataset."""
     parser = argparse.ArgumentParser(description=usage,
                                      formatter_class=argparse.ArgumentDefaultsHelpFormatter
                                      )
+    parser.add_argument('-f', '--format', choices=["jsonl", "binary"], help='jsonl file, or binary dataset folder', default="jsonl")
+    parser.add_argument('-o', '--output', type=str, help='Output file or folder (chromadb_export.jsonl or chromadb_export by default), jsonl being gzipped if ending with .gz')
+    parser.add_argument('-p', '--page-size', type=int, help='Entries read from the database at a time', default=1000)
+    parser.add_argument('--where', type=json.loads, help='Metadata filter in Chroma syntax, e.g. \'{"applicability": "2012-01-01"}\'')
+    parser.add_argument('--where-document', type=json.loads, help='Document filter in Chroma syntax, e.g. \'{"$contains": "bail"}\'')
     parser.add_argument("chromadb_path", type=str, help="Chroma DB Path")
     args = parser.parse_args()
 
@@ -24,26 +69,17 @@ def main():
         tenant=chromadb.config.DEFAULT_TENANT,
         database=chromadb.config.DEFAULT_DATABASE,
     )
-    
+
     vectordb = db_client.get_collection(name="swiss_legal_articles")
-    included_fields = [chromadb.api.types.IncludeEnum.metadatas,
-                       chromadb.api.types.IncludeEnum.documents,
-                       chromadb.api.types.IncludeEnum.embeddings]
-    docs = vectordb.get(include=included_fields)
-    rows = zip(docs["ids"], docs["embeddings"], docs["documents"], docs["metadatas"])
-
-    output_file = "chromadb_export.jsonl"
-    with open(output_file, "w") as f:
-        for row in rows:
-            line = {
-                "uid": row[0],
-                "embedding": row[1].tolist(),  # Convert ndarray to list for JSON serialization
-                "document": row[2],
-                "metadata": row[3]
-            }
-            f.write(json.dumps(line) + "\n")  # Write each dictionary as a JSON line
-
-    print(f"Data exported to {output_file}")
+    pages = iter_pages(vectordb, args.page_size, args.where, args.where_document)
+    if args.format == "binary":
+        output_file = args.output or "chromadb_export"
+        count = export_binary(pages, output_file)
+    else:
+        output_file = args.output or "chromadb_export.jsonl"
+        count = export_jsonl(pages, output_file)
+
+    print(f"{count} entries exported to {output_file}")
 
 
 if __name__ == "__main__":
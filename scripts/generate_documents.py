@@ -1,161 +1,353 @@
 import argparse
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+import functools
 import gzip
 import hashlib
+import io
+import itertools
 import json
 import logging
 import os
-from typing import Dict, List, Optional
+from typing import Dict, Iterator, List, Optional, Set
 import xml.etree.ElementTree as ET
 
-from helpers import setup_logging_levels
+try:
+    from lxml import etree as lxml_etree
+except ImportError:
+    lxml_etree = None
 
+from document_cache import DocumentCache, add_records
+from helpers import setup_logging_levels
 
-def get_full_text(element: ET.Element) -> str:
-    """Recursively extracts all text from an XML element, preserving order and spacing."""
-    texts = []
 
-    if element is None:
-        return ""
+def _collect_text(element: ET.Element, parts: List[str]) -> None:
+    is_first = True
 
     # Add element's text, if it exists
     if element.text and element.text.strip():
-        texts.append(element.text.strip())
-    
-    # Recursively get text from each child element
+        parts.append(element.text.strip())
+        is_first = False
+
     for child in element:
-        texts.append(get_full_text(child))
-        
+        if not is_first:
+            parts.append(' ')
+        is_first = False
+        _collect_text(child, parts)
+
         # Include any tail text that follows the child
         if child.tail and child.tail.strip():
-            texts.append(child.tail.strip())
-    
-    # Join all collected text parts with spaces for readability
-    return ' '.join(texts)
+            parts.append(' ')
+            parts.append(child.tail.strip())
 
 
-# Function to find the full path of parents for each matching element
-def get_parent_chain(element: ET.Element, element_map: Dict[ET.Element, ET.Element]) -> List[ET.Element]:
-    path = []
-    while element is not None:
-        path.append(element)
-        element = element_map.get(element)  # Move to the parent
-    return path[::-1]  # Reverse to get root-to-child order
+def get_full_text(element: ET.Element) -> str:
+    """Extracts all text from an XML element, preserving order and spacing.
 
+    Text parts of the element and of each child subtree are joined with spaces. Parts are
+    collected in a single list for the whole subtree, so that the cost is linear in its size.
+    """
+    if element is None:
+        return ""
 
-def find_articles_with_parents(root: ET.Element, ns):
+    parts = []
+    _collect_text(element, parts)
+    return ''.join(parts)
+
+
+AKN_NS = 'http://docs.oasis-open.org/legaldocml/ns/akn/3.0'
+NAMESPACES = {
+    'akn': AKN_NS,
+    'fedlex': 'http://fedlex.admin.ch/'
+}
+TAG_ACT = f"{{{AKN_NS}}}act"
+TAG_BODY = f"{{{AKN_NS}}}body"
+TAG_ARTICLE = f"{{{AKN_NS}}}article"
+TAG_LEVEL = f"{{{AKN_NS}}}level"
+TAG_NUM = f"{{{AKN_NS}}}num"
+TAG_HEADING = f"{{{AKN_NS}}}heading"
+
+PARSE_ERRORS = (ET.ParseError,)
+if lxml_etree is not None:
+    PARSE_ERRORS += (lxml_etree.XMLSyntaxError,)
+    # the stdlib parser drops comments and processing instructions as well
+    _LXML_PARSER = lxml_etree.XMLParser(remove_comments=True, remove_pis=True, huge_tree=True)
+    _XPATH_BODY = lxml_etree.XPath("akn:act/akn:body", namespaces=NAMESPACES)
+    _XPATH_IDENTIFICATION = lxml_etree.XPath("akn:act/akn:meta/akn:identification", namespaces=NAMESPACES)
+    _XPATH_DATE = lxml_etree.XPath("akn:FRBRWork/akn:FRBRdate[@name=$name]/@date", namespaces=NAMESPACES)
+    _XPATH_DOC_TITLE = lxml_etree.XPath("akn:act/akn:preface/akn:p/akn:docTitle", namespaces=NAMESPACES)
+    _XPATH_ARTICLES = lxml_etree.XPath(".//akn:article", namespaces=NAMESPACES)
+    _XPATH_LEVELS = lxml_etree.XPath(".//akn:level", namespaces=NAMESPACES)
+    _XPATH_NUM = lxml_etree.XPath("akn:num[1]", namespaces=NAMESPACES)
+    _XPATH_HEADING = lxml_etree.XPath("akn:heading[1]", namespaces=NAMESPACES)
 
-    # Build a map of elements to their parents
-    element_map = {child: parent for parent in root.iter() for child in parent}
-    articles_with_parents = []
 
-    # Find all `akn:article` elements and retrieve their parent chain
-    for article in root.findall(".//akn:article", ns):
-        parent_chain = get_parent_chain(article, element_map)
-        articles_with_parents.append((article, parent_chain))
-    
-    return articles_with_parents
+def single_line(text):
+    # Remove newlines and reduce multiple spaces to a single space
+    return ' '.join(text.replace('\n', ' ').split())
 
 
-def find_first_level_with_parents(root: ET.Element, ns):
-    # Build a map of elements to their parents
-    element_map = {child: parent for parent in root.iter() for child in parent}
-    levels_with_parents = []
+def read_header(root: ET.Element) -> Dict[str, str]:
+    """Extracts the document title and dates shared by all articles of a document."""
+    ns = NAMESPACES
 
-    # Find all "level" elements
-    all_levels = root.findall(".//akn:level", ns)
+    # Extract metadata
+    meta_data = root.find('akn:act/akn:meta/akn:identification', ns)
 
-    # Filter to get only the "last level" elements (those with no child "level" elements)
-    last_levels = [level for level in all_levels if not level.findall(".//akn:level", ns)]
+    # Extract full document title using the helper function
+    doc_title_element = root.find('akn:act/akn:preface/akn:p/akn:docTitle', ns)
+    doc_title = single_line(get_full_text(doc_title_element) if doc_title_element is not None else "Unknown Title")
 
-    for level in last_levels:
-        parent_chain = get_parent_chain(level, element_map)
-        levels_with_parents.append((level, parent_chain))
-    
-    return levels_with_parents
+    return {
+        "doc_title": doc_title,
+        "doc_date": meta_data.find("akn:FRBRWork/akn:FRBRdate[@name='jolux:dateDocument']", ns).get('date'),
+        "entry_in_force": meta_data.find("akn:FRBRWork/akn:FRBRdate[@name='jolux:dateEntryInForce']", ns).get('date'),
+        "applicability": meta_data.find("akn:FRBRWork/akn:FRBRdate[@name='jolux:dateApplicability']", ns).get('date')
+    }
 
 
-def single_line(text):
-    # Remove newlines and reduce multiple spaces to a single space
-    return ' '.join(text.replace('\n', ' ').split())
+class _OpenElement:
+    """Element being parsed, with the num and heading of its own needed by the hierarchy of its descendants."""
+    __slots__ = ("element", "num", "heading", "needs_text", "hierarchy", "slot")
+
+    def __init__(self, element: ET.Element, needs_text: bool):
+        self.element = element
+        self.num = None
+        self.heading = None
+        # full text of the element is needed when it closes: its subtree must be kept until then
+        self.needs_text = needs_text
+        # hierarchy from the body down to this element, computed once for all its descendants
+        self.hierarchy = None
+        # position of an article among the pending items of the outermost open article
+        self.slot = None
+
+    @property
+    def label(self) -> str:
+        return single_line(f"{self.num or ''} {self.heading or ''}")
+
+
+def _join_labels(prefix: str, label: str) -> str:
+    # same as single_line over labels joined with " / ", without rescanning the prefix
+    return " ".join(part for part in (prefix, "/", label) if part)
+
+
+def iter_articles(document_path: str) -> Iterator[Dict[str, str]]:
+    """Streams the articles of an Akoma Ntoso document as they are parsed.
+
+    Articles are emitted as soon as they close and their subtree is discarded. Articles nested in
+    an article are held until the outermost one closes, so that all come in document order.
+    Documents without articles are split on leaf levels (levels without nested levels) instead,
+    and documents without either yield their whole text as a single item.
+
+    Raises:
+        ET.ParseError: the document is not well-formed
+    """
+    stack: List[_OpenElement] = []
+    count_needing_text = 0
+    header = None
+    body_state = "before"  # "before", "inside" and "after" the first act body
+    found_article = False
+    levels = []
+    # items of the articles opened within the outermost open article, in document order
+    pending_articles: List[Optional[Dict[str, str]]] = []
+    count_open_articles = 0
+
+    def make_item(entry: _OpenElement, text: str) -> Dict[str, str]:
+        # stack[2] is the body, whose items are children of
+        prefix = None
+        for ancestor in stack[2:]:
+            if ancestor.hierarchy is None:
+                ancestor.hierarchy = ancestor.label if prefix is None else _join_labels(prefix, ancestor.label)
+            prefix = ancestor.hierarchy
+
+        item = dict(header)
+        item.update({
+            "hierarchy": _join_labels(prefix, entry.label),
+            "article_number": entry.num or "",
+            "article_text": text
+        })
+        return item
+
+    for event, element in ET.iterparse(document_path, events=("start", "end")):
+        if event == "start":
+            needs_text = False
+            if body_state == "inside":
+                if element.tag in (TAG_ARTICLE, TAG_NUM, TAG_HEADING):
+                    needs_text = True
+                    if element.tag == TAG_ARTICLE:
+                        count_open_articles += 1
+                        pending_articles.append(None)
+
+                elif element.tag == TAG_LEVEL:
+                    # enclosing levels are not leaves
+                    for entry in stack[2:]:
+                        if entry.needs_text and entry.element.tag == TAG_LEVEL:
+                            entry.needs_text = False
+                            count_needing_text -= 1
+                    needs_text = not found_article
+
+            elif body_state == "before" and element.tag == TAG_BODY and len(stack) == 2 and stack[1].element.tag == TAG_ACT:
+                body_state = "inside"
+                header = read_header(stack[0].element)
+                logging.info("document title: %s", header["doc_title"])
+
+            count_needing_text += needs_text
+            stack.append(_OpenElement(element, needs_text))
+            if needs_text and element.tag == TAG_ARTICLE:
+                stack[-1].slot = len(pending_articles) - 1
+            continue
+
+        entry = stack.pop()
+        if body_state != "inside" or len(stack) < 2:
+            continue
+
+        if len(stack) == 2:
+            # end of body: the tree is not needed any further
+            body_state = "after"
+            stack[1].element.remove(element)
+            continue
+
+        parent = stack[-1]
+        if entry.needs_text:
+            count_needing_text -= 1
+            text = get_full_text(element)
+            if element.tag == TAG_NUM:
+                if parent.num is None:
+                    parent.num = text
+                    parent.hierarchy = None
+
+            elif element.tag == TAG_HEADING:
+                if parent.heading is None:
+                    parent.heading = text
+                    parent.hierarchy = None
+
+            elif text and element.tag == TAG_ARTICLE:
+                if not found_article:
+                    found_article = True
+                    levels = []
+                    # levels are only used as fallback for documents without articles
+                    for open_entry in stack:
+                        if open_entry.needs_text and open_entry.element.tag == TAG_LEVEL:
+                            open_entry.needs_text = False
+                            count_needing_text -= 1
+
+                pending_articles[entry.slot] = make_item(entry, text)
+
+            elif text and element.tag == TAG_LEVEL:
+                levels.append(make_item(entry, text))
+
+        if entry.slot is not None:
+            count_open_articles -= 1
+            if count_open_articles == 0:
+                yield from (item for item in pending_articles if item is not None)
+                pending_articles.clear()
+
+        if count_needing_text == 0:
+            # no enclosing element needs the text of this subtree anymore
+            element.clear()
+            parent.element.remove(element)
+
+    if found_article or body_state == "before":
+        return
+
+    yield from levels
+    if not levels:
+        # body text has been discarded while streaming, parse again for this rare case
+        yield dict(header, hierarchy="N/A", article_number="N/A", article_text=get_full_text(ET.parse(document_path).getroot()))
+
+
+def iter_articles_lxml(document_path: str) -> Iterator[Dict[str, str]]:
+    """Extracts the same items as `iter_articles` from a document loaded with lxml.
+
+    Elements are located with precompiled XPath expressions and ancestors are reached with
+    `getparent()`, so that no parent map is built. Leaf levels are found by marking the
+    ancestors of each level once, and hierarchies are memoized per element.
+
+    Raises:
+        lxml.etree.XMLSyntaxError: the document is not well-formed
+    """
+    root = lxml_etree.parse(document_path, _LXML_PARSER).getroot()
+    body = _XPATH_BODY(root)
+    if not body:
+        return
+    body = body[0]
+
+    identification = _XPATH_IDENTIFICATION(root)[0]
+    doc_title_element = _XPATH_DOC_TITLE(root)
+    header = {
+        "doc_title": single_line(get_full_text(doc_title_element[0]) if doc_title_element else "Unknown Title"),
+        "doc_date": _XPATH_DATE(identification, name="jolux:dateDocument")[0],
+        "entry_in_force": _XPATH_DATE(identification, name="jolux:dateEntryInForce")[0],
+        "applicability": _XPATH_DATE(identification, name="jolux:dateApplicability")[0]
+    }
+    logging.info("document title: %s", header["doc_title"])
 
+    hierarchies = {}
 
-def load_articles(document_path: str) -> List[Dict[str, str]]:
-    # Load the XML document
-    try:
-        tree = ET.parse(document_path)
+    def label(element) -> str:
+        num = _XPATH_NUM(element)
+        heading = _XPATH_HEADING(element)
+        return single_line(f"{get_full_text(num[0]) if num else ''} {get_full_text(heading[0]) if heading else ''}")
 
-    except ET.ParseError as e:
-        logging.error("error while parsing %s: skipping %s", e, document_path)
-        return []
+    def hierarchy(element) -> str:
+        if element is body:
+            return label(body)
 
-    root = tree.getroot()
+        if element not in hierarchies:
+            hierarchies[element] = _join_labels(hierarchy(element.getparent()), label(element))
+        return hierarchies[element]
 
-    # Namespaces
-    ns = {
-        'akn': 'http://docs.oasis-open.org/legaldocml/ns/akn/3.0',
-        'fedlex': 'http://fedlex.admin.ch/'
-    }
+    def make_items(elements) -> List[Dict[str, str]]:
+        items = []
+        for element in elements:
+            text = get_full_text(element)
+            if text:
+                num = _XPATH_NUM(element)
+                item = dict(header)
+                item.update({
+                    "hierarchy": _join_labels(hierarchy(element.getparent()), label(element)),
+                    "article_number": get_full_text(num[0]) if num else "",
+                    "article_text": text
+                })
+                items.append(item)
+        return items
 
-    # Extract metadata
-    meta_data = root.find('akn:act/akn:meta/akn:identification', ns)
-    dates = {
-        "document": meta_data.find("akn:FRBRWork/akn:FRBRdate[@name='jolux:dateDocument']", ns).get('date'),
-        "entry_in_force": meta_data.find("akn:FRBRWork/akn:FRBRdate[@name='jolux:dateEntryInForce']", ns).get('date'),
-        "applicability": meta_data.find("akn:FRBRWork/akn:FRBRdate[@name='jolux:dateApplicability']", ns).get('date')
-    }
+    items = make_items(_XPATH_ARTICLES(body))
+    if not items:
+        levels = _XPATH_LEVELS(body)
+        not_leaves = set()
+        for level in levels:
+            parent = level.getparent()
+            while parent is not body:
+                if parent.tag == TAG_LEVEL:
+                    if parent in not_leaves:
+                        # ancestors above have been marked already
+                        break
+                    not_leaves.add(parent)
+                parent = parent.getparent()
 
-    # Extract full document title using the helper function
-    doc_title_element = root.find('akn:act/akn:preface/akn:p/akn:docTitle', ns)
-    doc_title = single_line(get_full_text(doc_title_element) if doc_title_element is not None else "Unknown Title")
+        items = make_items(level for level in levels if level not in not_leaves)
 
-    logging.info("document title: %s", doc_title)
+    if not items:
+        items = [dict(header, hierarchy="N/A", article_number="N/A", article_text=get_full_text(root))]
 
-    def extract_items(items_with_parents) -> List[Dict[str, str]]:
-        items = []
-        # Append item text with current context
-        for item, parent_chain in items_with_parents:
-            item_text = get_full_text(item)
-            item_num = get_full_text(item.find("akn:num", ns)) or ""
-            hierarchy = [f"{get_full_text(p.find("akn:num", ns))} {get_full_text(p.find("akn:heading", ns))}" for p in parent_chain if p.tag != "body"]
-            hierarchy_text = single_line(" / ".join(hierarchy))
-
-            item_with_context = {
-                "doc_title": doc_title,
-                "doc_date": dates["document"],
-                "entry_in_force": dates["entry_in_force"],
-                "applicability": dates["applicability"],
-                "hierarchy": hierarchy_text,
-                "article_number": item_num,
-                "article_text": item_text
-            }
-            if item_with_context["article_text"]:
-                items.append(item_with_context)
+    yield from items
 
-        return items
-    
-    body = root.find("akn:act/akn:body", ns)
-    if body is None:
+
+PARSERS = {
+    "etree": iter_articles,
+    "lxml": iter_articles_lxml,
+}
+
+
+def load_articles(document_path: str, parser: str = "etree") -> List[Dict[str, str]]:
+    try:
+        extracted = list(PARSERS[parser](document_path))
+
+    except PARSE_ERRORS as e:
+        logging.error("error while parsing %s: skipping %s", e, document_path)
         return []
-    
-    # Initialize extraction with root body context, handle articles directly within the body
-    articles_with_parents = find_articles_with_parents(body, ns)
-    extracted = extract_items(articles_with_parents)
-    if len(extracted) == 0:
-        # try splitting using 1st level
-        first_level_with_parents = find_first_level_with_parents(body, ns)
-        extracted = extract_items(first_level_with_parents)
-        if len(extracted) == 0:
-            extracted = [{
-                    "doc_title": doc_title,
-                    "doc_date": dates["document"],
-                    "entry_in_force": dates["entry_in_force"],
-                    "applicability": dates["applicability"],
-                    "hierarchy": "N/A",
-                    "article_number": "N/A",
-                    "article_text": get_full_text(root)
-                }
-            ]
-    
+
     logging.info("%s articles extracted from %s", len(extracted), document_path)
     return extracted
 
@@ -188,6 +380,115 @@ def format_chunks(chunks: List[Dict[str, str]]) -> List[str]:
     return formatted_chunks
 
 
+def to_json_lines(document: str, downloads_folder: str, structured_articles: List[Dict[str, str]],
+                  articles: List[str]) -> List[str]:
+    """Serializes formatted articles of a document as json lines, with their metadata and uid."""
+    doc_meta = {
+        "doc_url": document[len(downloads_folder):],
+        "doc_date": structured_articles[-1]["doc_date"],
+        "entry_in_force": structured_articles[-1]["entry_in_force"],
+        "applicability": structured_articles[-1]["applicability"],
+    }
+
+    doc_ids = [hashlib.md5(article.encode()).hexdigest() for article in articles]
+
+    lines = []
+    for count_para, article in enumerate(articles):
+        doc_data = doc_meta.copy()
+        doc_data.update({"text": article, "uid": doc_ids[count_para]})
+        lines.append(json.dumps(doc_data) + "\n")
+
+    return lines
+
+
+def build_document_lines(document: str, downloads_folder: str, parser: str = "etree") -> List[str]:
+    """Extracts the articles of a document as serialized json lines, with their metadata and uid."""
+    logging.info(f"creating documents for {document}")
+
+    structured_articles = load_articles(document, parser)
+    articles = format_chunks(structured_articles)
+    if len(articles) == 0:
+        logging.warning("unable to extract data from document: %s", document)
+        return []
+
+    lengths = [len(p) for p in articles]
+    logging.info(f"processing {len(articles)} articles, for a total of {sum(lengths)} characters (max {max(lengths)}) ")
+
+    return to_json_lines(document, downloads_folder, structured_articles, articles)
+
+
+def build_chunk_lines(documents: List[str], downloads_folder: str, parser: str = "etree") -> List[List[str]]:
+    return [build_document_lines(document, downloads_folder, parser) for document in documents]
+
+
+def iter_document_lines(documents: List[str], downloads_folder: str, workers: int, parser: str = "etree") -> Iterator[List[str]]:
+    """Yields the json lines of each document in the order of `documents`, parsing in `workers` processes."""
+    build = functools.partial(build_document_lines, downloads_folder=downloads_folder, parser=parser)
+    if workers <= 1:
+        yield from map(build, documents)
+        return
+
+    # tasks are submitted in chunks to limit inter-process overhead, at most 2 chunks per worker being
+    # in flight so that results waiting to be consumed do not pile up in memory
+    chunk_size = max(1, min(64, len(documents) // (workers * 8)))
+    chunks = (documents[start:start + chunk_size] for start in range(0, len(documents), chunk_size))
+    build_chunk = functools.partial(build_chunk_lines, downloads_folder=downloads_folder, parser=parser)
+    with ProcessPoolExecutor(max_workers=workers, initializer=setup_logging_levels) as executor:
+        pending = deque(executor.submit(build_chunk, chunk) for chunk in itertools.islice(chunks, 2 * workers))
+        while pending:
+            lines = pending.popleft().result()
+            chunk = next(chunks, None)
+            if chunk is not None:
+                pending.append(executor.submit(build_chunk, chunk))
+            yield from lines
+
+
+def iter_incremental_lines(documents: List[str], downloads_folder: str, workers: int, parser: str,
+                           cache: DocumentCache, changes: Dict[str, Set[str]], force: bool = False) -> Iterator[List[str]]:
+    """Yields the json lines of each document in order, only parsing documents not found in the cache,
+    or all of them with `force`.
+
+    Uids of articles added, removed or whose record changed are collected in `changes`, comparing all
+    the records of the previous and of the new output, those of unchanged documents included.
+    """
+    doc_urls = [document[len(downloads_folder):] for document in documents]
+    # cached lines of documents parsed again still give the previous records
+    fresh = [not force and cache.is_fresh(doc_url, document) for doc_url, document in zip(doc_urls, documents)]
+    changed_documents = [document for document, is_fresh in zip(documents, fresh) if not is_fresh]
+    logging.info("%d documents out of %s changed since last build", len(changed_documents), len(documents))
+
+    previous_records: Dict[str, Set[str]] = {}
+    removed_urls = set(cache.doc_urls()).difference(doc_urls)
+    for doc_url in removed_urls:
+        add_records(previous_records, cache.get(doc_url).lines)
+        cache.delete(doc_url)
+
+    new_records: Dict[str, Set[str]] = {}
+    built = iter_document_lines(changed_documents, downloads_folder, workers, parser)
+    for doc_url, document, is_fresh in zip(doc_urls, documents, fresh):
+        if is_fresh:
+            lines = cache.get(doc_url).lines
+            # records of unchanged documents are part of both outputs
+            add_records(previous_records, lines)
+            add_records(new_records, lines)
+            yield lines
+            continue
+
+        lines = next(built)
+        previous = cache.get(doc_url)
+        if previous is not None:
+            add_records(previous_records, previous.lines)
+        add_records(new_records, lines)
+        cache.put(doc_url, document, lines)
+        yield lines
+
+    built.close()
+    cache.commit()
+    changes["added"] = new_records.keys() - previous_records.keys()
+    changes["removed"] = previous_records.keys() - new_records.keys()
+    changes["changed"] = {uid for uid in new_records.keys() & previous_records.keys() if new_records[uid] != previous_records[uid]}
+
+
 def main():
 
     setup_logging_levels()
@@ -197,48 +498,46 @@ def main():
     parser = argparse.ArgumentParser(description=usage,
                                      formatter_class=argparse.ArgumentDefaultsHelpFormatter
                                      )
+    parser.add_argument('-w', '--workers', type=int, help='Number of processes parsing documents', default=1)
+    parser.add_argument('-p', '--parser', choices=list(PARSERS), help='XML parser backend (lxml must be installed)', default="etree")
+    parser.add_argument('--full', action='store_true', help='Parse all documents again instead of reusing records of unchanged ones')
     parser.add_argument("downloads_folder", type=str, help="Raw documents folder")
     parser.add_argument("output_folder", type=str, help="Directory where documents file is saved")
 
     args = parser.parse_args()
+    if args.parser == "lxml" and lxml_etree is None:
+        parser.error("lxml parser selected but lxml is not installed")
 
     output_file = f"{args.output_folder}/law_articles.jsonl.gz"
+    cache_file = f"{args.output_folder}/law_articles.cache.sqlite"
+    changes_file = f"{args.output_folder}/law_articles.changes.json"
 
     logging.info("processing documents from %s", args.downloads_folder)
 
     documents = sorted(list_all_files(args.downloads_folder))
     count_vectors = 0
 
-    with gzip.open(output_file, "wt", encoding="utf-8") as out_file:
-        for count_doc, document in enumerate(documents):
+    cache = DocumentCache(cache_file)
+    changes = {}
 
-            logging.info(f"creating documents for {document}")
+    document_lines = iter_incremental_lines(documents, args.downloads_folder, args.workers, args.parser, cache, changes,
+                                            force=args.full)
+    # a fixed gzip timestamp keeps the output reproducible from one build to the next
+    with gzip.GzipFile(output_file, "wb", mtime=0) as gzip_file, io.TextIOWrapper(gzip_file, encoding="utf-8") as out_file:
+        for count_doc, lines in enumerate(document_lines):
+            count_vectors += len(lines)
+            out_file.writelines(lines)
 
-            structured_articles = load_articles(document)
-            articles = format_chunks(structured_articles)
-            if len(articles) == 0:
-                logging.warning("unable to extract data from document: %s", document)
-                continue
-
-            doc_meta = {
-                "doc_url": document[len(args.downloads_folder):],
-                "doc_date": structured_articles[-1]["doc_date"],
-                "entry_in_force": structured_articles[-1]["entry_in_force"],
-                "applicability": structured_articles[-1]["applicability"],
-            }
-
-            lengths = [len(p) for p in articles]
-            logging.info(f"processing {len(articles)} articles, for a total of {sum(lengths)} characters (max {max(lengths)}) ")
+        logging.warning("saved under %s: processed %s files out of %s (%s vectors)", os.path.abspath(output_file), count_doc + 1, len(documents), count_vectors)
 
-            doc_ids = [hashlib.md5(article.encode()).hexdigest() for article in articles]
+    cache.close()
 
-            for count_para, article in enumerate(articles):
-                count_vectors += 1
-                doc_data = doc_meta.copy()
-                doc_data.update({"text": article, "uid": doc_ids[count_para]})
-                out_file.write(json.dumps(doc_data) + "\n")
+    # lets downstream stages only process what changed
+    with open(changes_file, "w") as f:
+        json.dump({kind: sorted(uids) for kind, uids in changes.items()}, f, indent=3)
 
-        logging.warning("saved under %s: processed %s files out of %s (%s vectors)", os.path.abspath(output_file), count_doc + 1, len(documents), count_vectors)
+    logging.warning("articles added: %d, removed: %d, changed: %d (listed in %s)",
+                    len(changes["added"]), len(changes["removed"]), len(changes["changed"]), changes_file)
 
 
 if __name__ == "__main__":
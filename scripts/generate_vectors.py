@@ -1,31 +1,74 @@
 import argparse
-import gzip
 import json
 import logging
 import os
-from typing import Dict, List
+from typing import Dict, Iterable, Iterator, List, Optional, Set, TextIO, Tuple
 
-import chromadb
+import numpy as np
 
 from embedding import EmbeddingModel
-from helpers import setup_logging_levels
-
-
-def load_jsonl(file_path: str) -> List[Dict[str, str]]:
-    data = []
-    open_func = gzip.open if file_path.endswith('.gz') else open
-    
-    with open_func(file_path, 'rt', encoding='utf-8') as f:
-        for line in f:
-            data.append(json.loads(line.strip()))
-    
-    return data
-
-
-def embed(embedding_model: EmbeddingModel, documents: List[str]) -> None:
+from embedding_cache import EmbeddingCache
+from embedding_engine import MAX_TOKENS_PER_REQUEST, OVERSIZE_POLICIES
+from helpers import iter_jsonl, setup_logging_levels
+from local_embedding import HashingEmbeddingBackend
+from vectors_writer import VectorsWriter
+
+
+def iter_new_documents(documents: Iterable[Dict[str, str]], stored_uids: Set[str], size: int) -> Iterator[List[Dict[str, str]]]:
+    """Groups documents not stored yet in lists of `size`, skipping repeated uids."""
+    batch = []
+    for document in documents:
+        if document["uid"] in stored_uids:
+            continue
+        stored_uids.add(document["uid"])
+        batch.append(document)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def embed_with_representatives(embedding_model: EmbeddingModel, texts: List[str], uids: List[str],
+                               representatives: Dict[str, str]) -> Tuple[List[Optional[np.ndarray]], Dict[int, str], int]:
+    """Embeds texts, near-duplicates reusing the vector of their representative when it was already computed.
+
+    Returns vectors aligned with texts, reasons of rejections by index and the number of reused vectors.
+    """
+    shared = {index: representatives[uid] for index, uid in enumerate(uids) if uid in representatives}
+    vectors: List[Optional[np.ndarray]] = [None] * len(texts)
+    rejected = {}
+
+    def embed_texts(indices: List[int]) -> None:
+        result = embedding_model.embed_documents([texts[index] for index in indices])
+        for index, vector in zip(indices, result.vectors):
+            vectors[index] = vector
+        rejected.update({indices[position]: reason for position, reason in result.rejected.items()})
+
+    own = [index for index in range(len(texts)) if index not in shared]
+    if own:
+        embed_texts(own)
+
+    # uids are the text hashes of the articles, i.e. their key in the embedding cache
+    reused = embedding_model.cached_vectors(sorted(set(shared.values())))
+    fallback = []
+    for index, representative in shared.items():
+        if representative in reused:
+            vectors[index] = reused[representative]
+        else:
+            fallback.append(index)
+    if fallback:
+        embed_texts(fallback)
+
+    return vectors, rejected, len(shared) - len(fallback)
+
+
+def embed(embedding_model: EmbeddingModel, documents: List[str],
+          representatives: Optional[Dict[str, str]] = None) -> Tuple[List[Dict], List[Dict[str, str]], int]:
     documents_text = [item["text"] for item in documents]
     documents_uid = [item["uid"] for item in documents]
-    vectors = embedding_model.embed(documents_text)
+    vectors, rejected, count_reused = embed_with_representatives(embedding_model, documents_text, documents_uid,
+                                                                 representatives or {})
     doc_metadata = [
         {
             "doc_url": document["doc_url"],
@@ -36,21 +79,39 @@ def embed(embedding_model: EmbeddingModel, documents: List[str]) -> None:
     ]
     results = []
     for doc_text, doc_uid, vector, metadata in zip(documents_text, documents_uid, vectors, doc_metadata):
+        if vector is None:
+            continue
         results.append(
             {"uid": doc_uid, "embedding": vector.tolist(), "document": doc_text, "metadata": metadata}
         )
-    return results
+    rejections = [{"uid": documents_uid[index], "doc_url": documents[index]["doc_url"], "reason": reason}
+                  for index, reason in sorted(rejected.items())]
+    return results, rejections, count_reused
+
 
+def load_representatives(duplicates_file: str) -> Dict[str, str]:
+    """Representative uid of each near-duplicate listed by dedup-documents."""
+    return {entry["uid"]: entry["representative"] for entry in iter_jsonl(duplicates_file)}
 
-def batch_process_documents(output_file, embedding_model, documents, write_batch_size=1):
-    for i in range(0, len(documents), write_batch_size):
-        batch = documents[i:i + write_batch_size]
-        rows = embed(embedding_model, batch)
-        with open(output_file, "a") as f:
-            for row in rows:
-                f.write(json.dumps(row) + "\n")  # Write each dictionary as a JSON line
 
-        logging.info("stored %s elements in db", len(batch))
+def batch_process_documents(writer: VectorsWriter, embedding_model: EmbeddingModel, batches: Iterable[List[Dict[str, str]]],
+                            rejected_file: TextIO, representatives: Optional[Dict[str, str]] = None) -> Tuple[int, int, int]:
+    count_processed = 0
+    count_rejected = 0
+    count_reused = 0
+    for batch in batches:
+        rows, rejections, batch_reused = embed(embedding_model, batch, representatives)
+        for row in rows:
+            writer.write(row)
+        for rejection in rejections:
+            rejected_file.write(json.dumps(rejection) + "\n")
+
+        count_processed += len(batch)
+        count_rejected += len(rejections)
+        count_reused += batch_reused
+        logging.info("stored %s elements in db, %s rejected (%s processed)", len(rows), len(rejections), count_processed)
+
+    return count_processed, count_rejected, count_reused
 
 
 def main():
@@ -59,7 +120,7 @@ def main():
     logging.getLogger("httpx").setLevel(logging.WARNING)
 
     usage = """Setting up Chroma Vector Database.
-    Requires environment variable MISTRAL_API_KEY.
+    Requires environment variable MISTRAL_API_KEY, unless using the local backend.
     """
     parser = argparse.ArgumentParser(description=usage,
                                      formatter_class=argparse.ArgumentDefaultsHelpFormatter
@@ -67,46 +128,62 @@ def main():
     
     parser.add_argument("-m", "--embedding-model", required=False, default="mistral-embed",
                         action="store", type=str, dest="embedding_model", help="Embedding model")
-    parser.add_argument('-b', '--batch-size', type=int, help='Batch size for reducing requests rate', default=5)
+    parser.add_argument('--backend', choices=["mistral", "local"], help='Embeddings from the Mistral API, or computed offline by hashing words', default="mistral")
+    parser.add_argument('--threads', type=int, help='Number of threads of the local backend (all cores by default)')
+    parser.add_argument('-b', '--batch-size', type=int, help='Maximum number of documents per request', default=128)
+    parser.add_argument('-t', '--max-tokens', type=int, help='Maximum estimated number of tokens per request', default=MAX_TOKENS_PER_REQUEST)
+    parser.add_argument('-o', '--oversize', choices=OVERSIZE_POLICIES, help='Handling of documents above the input size of the model: embedded in parts whose vectors are averaged, cut or rejected', default="split")
+    parser.add_argument('-c', '--concurrency', type=int, help='Maximum number of requests in flight', default=4)
+    parser.add_argument('-r', '--rate', type=float, help='Maximum requests per second, lowered automatically when rate limited', default=5.)
+    parser.add_argument('-w', '--write-batch-size', type=int, help='Number of documents embedded between two writes to the output file', default=1000)
+    parser.add_argument('--checkpoint-every', type=int, help='Number of vectors written between two flushes to disk', default=5000)
+    parser.add_argument('--embedding-cache', type=str, help='Embeddings already computed, by model and text hash', default="output/embeddings.cache.sqlite")
+    parser.add_argument('--duplicates', type=str, help='Near-duplicates found by dedup-documents, reusing the vector of their representative')
+    parser.add_argument('--server-url', type=str, help='Embedding API endpoint, e.g. a local stand-in-embedding-server')
     parser.add_argument("documents_file", type=str, help="Documents file as .jsonl (may be gzipped)")
 
     args = parser.parse_args()
 
     embedding_api_key = os.environ.get("MISTRAL_API_KEY")
 
+    os.makedirs(os.path.dirname(args.embedding_cache) or ".", exist_ok=True)
+    cache = EmbeddingCache(args.embedding_cache)
     embedding_model = EmbeddingModel(
         model_deployment=args.embedding_model,
         api_key=embedding_api_key,
-        batch_size=args.batch_size
+        batch_size=args.batch_size,
+        concurrency=args.concurrency,
+        requests_per_second=args.rate,
+        server_url=args.server_url,
+        max_tokens=args.max_tokens,
+        oversize_policy=args.oversize,
+        cache=cache,
+        backend=HashingEmbeddingBackend(workers=args.threads) if args.backend == "local" else None
     )
 
-    documents = load_jsonl(args.documents_file)
-
     logging.info("processing documents from %s", args.documents_file)
-    logging.info("loaded %s documents", len(documents))
+    representatives = load_representatives(args.duplicates) if args.duplicates else None
 
     vectors_file = "output/law_vectors.jsonl"
+    rejected_file = "output/law_vectors.rejected.jsonl"
 
     os.makedirs(os.path.dirname(vectors_file), exist_ok=True)
 
-    # Create the empty file if it does not exist
-    with open(vectors_file, 'a') as file:
-        pass  # 'pass' is used to create the file without adding any content
-
-    stored_uids = set()
-
-    # Open and read the jsonl file
-    with open(vectors_file, 'r') as file:
-        for line in file:
-            # Parse each line as a JSON object
-            data = json.loads(line)
-            stored_uids.add(data['uid'])
-    
-    new_documents = [d for d in documents if d["uid"] not in stored_uids]
-    logging.info("remaining %s documents", len(new_documents))
-    batch_process_documents(vectors_file, embedding_model, new_documents, write_batch_size=1)
-
-    logging.warning("processed %s documents", len(new_documents))
+    # rejected documents are tried again on each run, the report only lists those of the last one
+    with VectorsWriter(vectors_file, checkpoint_every=args.checkpoint_every) as writer, \
+            open(rejected_file, "w", encoding="utf-8") as rejected:
+        stored_uids = writer.open()
+        logging.info("found %s documents already stored", len(stored_uids))
+        batches = iter_new_documents(iter_jsonl(args.documents_file), stored_uids, args.write_batch_size)
+        count_processed, count_rejected, count_reused = batch_process_documents(writer, embedding_model, batches, rejected,
+                                                                                representatives)
+    cache.close()
+
+    logging.warning("processed %s documents", count_processed)
+    if representatives:
+        logging.warning("%s near-duplicates reused the vector of their representative", count_reused)
+    if count_rejected:
+        logging.warning("%s documents rejected, listed in %s", count_rejected, rejected_file)
 
 
 if __name__ == "__main__":
@@ -1,50 +1,74 @@
 import argparse
-import gzip
-import json
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+import logging
+from typing import Deque, Dict, List, Optional, Tuple
 
 import chromadb
 
+from embedding import MAX_NUMBER_DOCS
+from embedding_cache import EmbeddingCache, text_hash
 from helpers import setup_logging_levels
+from vector_dataset import iter_batches
 
 
-def import_data(vectordb: chromadb.Collection, data_path: str) -> None:
-    documents = []
-    metadatas = []
-    ids = []
-    embeddings = []
-
-    # Open file (support GZip if file ends in .gz)
-    open_func = gzip.open if data_path.endswith(".gz") else open
-    with open_func(data_path, 'rt', encoding='utf-8') as f:
-        for line in f:
-            entry = json.loads(line)
-            # Append data to lists for batch addition
-            ids.append(entry["uid"])
-            embeddings.append(entry["embedding"])
-            documents.append(entry["document"])
-            metadatas.append(entry["metadata"])
-
-    # Define the batch size
-    batch_size = 40000
-
-    # Function to chunk data into batches
-    def chunk_data(data, batch_size):
-        for i in range(0, len(data), batch_size):
-            yield data[i:i + batch_size]
-
-    # Iterate through each chunk
-    for doc_chunk, meta_chunk, id_chunk, emb_chunk in zip(
-        chunk_data(documents, batch_size),
-        chunk_data(metadatas, batch_size),
-        chunk_data(ids, batch_size),
-        chunk_data(embeddings, batch_size),
-    ):
-        vectordb.add(
-            documents=doc_chunk,
-            metadatas=meta_chunk,
-            ids=id_chunk,
-            embeddings=emb_chunk
+def hnsw_metadata(distance: str, m: Optional[int] = None, construction_ef: Optional[int] = None,
+                  search_ef: Optional[int] = None) -> Dict:
+    """Collection metadata setting the distance function and the HNSW parameters given, others keeping Chroma defaults."""
+    parameters = {"hnsw:space": distance, "hnsw:M": m, "hnsw:construction_ef": construction_ef, "hnsw:search_ef": search_ef}
+    return {key: value for key, value in parameters.items() if value is not None}
+
+
+def add_new(vectordb: chromadb.Collection, ids: List[str], embeddings: List, documents: List[str],
+            metadatas: List[Dict]) -> Tuple[int, int]:
+    """Upserts the rows whose id is not in the collection yet, returning the numbers of rows added and skipped."""
+    existing = set(vectordb.get(ids=ids, include=[])["ids"])
+    kept = [position for position, uid in enumerate(ids) if uid not in existing]
+    if kept:
+        vectordb.upsert(
+            ids=[ids[position] for position in kept],
+            embeddings=[embeddings[position] for position in kept],
+            documents=[documents[position] for position in kept],
+            metadatas=[metadatas[position] for position in kept]
         )
+    return len(kept), len(ids) - len(kept)
+
+
+def import_data(vectordb: chromadb.Collection, data_path: str, cache: Optional[EmbeddingCache] = None,
+                model: str = "mistral-embed", batch_size: int = 5000, workers: int = 4) -> Tuple[int, int]:
+    """Imports the vectors of a jsonl file or dataset folder, returning the numbers of rows added and skipped.
+
+    Input is read one batch at a time and at most `workers` batches are being written at once, so that
+    memory does not grow with the input. Rows whose id is already in the collection are skipped, so that
+    an interrupted import is resumed by running it again.
+    """
+    batch_size = min(batch_size, MAX_NUMBER_DOCS)
+    count_added = 0
+    count_skipped = 0
+    pending: Deque[Tuple[Future, List[str], List]] = deque()
+
+    def complete_oldest() -> None:
+        nonlocal count_added, count_skipped
+        future, documents, embeddings = pending.popleft()
+        added, skipped = future.result()
+        count_added += added
+        count_skipped += skipped
+        if cache is not None:
+            # imported vectors are not requested again by generate-vectors
+            cache.put_many(model, {text_hash(document): embedding for document, embedding in zip(documents, embeddings)})
+            cache.commit()
+        logging.info("imported %d rows, %d already present", count_added, count_skipped)
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for id_chunk, emb_chunk, doc_chunk, meta_chunk in iter_batches(data_path, batch_size):
+            if len(pending) >= workers:
+                complete_oldest()
+            pending.append((executor.submit(add_new, vectordb, id_chunk, emb_chunk, doc_chunk, meta_chunk),
+                            doc_chunk, emb_chunk))
+        while pending:
+            complete_oldest()
+
+    return count_added, count_skipped
 
 
 def main():
@@ -56,8 +80,15 @@ def main():
                                      formatter_class=argparse.ArgumentDefaultsHelpFormatter
                                             )
     parser.add_argument('-d', '--distance', choices=["l2", "ip", "cosine"], type=str, help='Distance function', default="cosine")
+    parser.add_argument('--M', type=int, dest="m", help='HNSW: maximum number of neighbours per node (Chroma default if not given)')
+    parser.add_argument('--construction-ef', type=int, help='HNSW: size of the candidate list when building (Chroma default if not given)')
+    parser.add_argument('--search-ef', type=int, help='HNSW: size of the candidate list when searching (Chroma default if not given)')
+    parser.add_argument("-m", "--embedding-model", type=str, help="Embedding model of the imported vectors", default="mistral-embed")
+    parser.add_argument('--embedding-cache', type=str, help='Embedding cache of generate-vectors, filled with the imported vectors')
+    parser.add_argument('-b', '--batch-size', type=int, help=f'Rows per upsert, at most {MAX_NUMBER_DOCS}', default=5000)
+    parser.add_argument('-w', '--workers', type=int, help='Number of batches written concurrently', default=4)
     parser.add_argument("chromadb_path", type=str, help="Chroma DB Path")
-    parser.add_argument("data", type=str, help="Data as jsonl file (may be compressed with GZip). Each line contains a dict with keys 'uid', 'embedding', 'document', 'metadata'")
+    parser.add_argument("data", type=str, help="Data as jsonl file (may be compressed with GZip), each line containing a dict with keys 'uid', 'embedding', 'document', 'metadata', or as binary dataset folder")
     args = parser.parse_args()
 
     # Vector database/Search index
@@ -68,9 +99,17 @@ def main():
         database=chromadb.config.DEFAULT_DATABASE,
     )
     
-    vectordb = db_client.create_collection(name="swiss_legal_articles", metadata={"hnsw:space": args.distance})
-    import_data(vectordb, args.data)
-    print("Data import complete.")
+    # an existing collection is completed, keeping its distance function and HNSW parameters
+    metadata = hnsw_metadata(args.distance, args.m, args.construction_ef, args.search_ef)
+    vectordb = db_client.get_or_create_collection(name="swiss_legal_articles", metadata=metadata)
+    distance = (vectordb.metadata or {}).get("hnsw:space", args.distance)
+    if distance != args.distance:
+        logging.warning("collection already exists with distance %s, not %s", distance, args.distance)
+    cache = EmbeddingCache(args.embedding_cache) if args.embedding_cache else None
+    count_added, count_skipped = import_data(vectordb, args.data, cache, args.embedding_model, args.batch_size, args.workers)
+    if cache is not None:
+        cache.close()
+    print(f"Data import complete: {count_added} rows added, {count_skipped} already present.")
 
 
 if __name__ == "__main__":
@@ -2,14 +2,24 @@ import argparse
 import logging
 import json
 import asyncio
-from typing import Optional
-from playwright.async_api import async_playwright
-from urllib.parse import urlparse
+from collections import Counter
+from typing import List, Optional
+from playwright.async_api import Page
+from playwright.async_api import Error as PlaywrightError
+from urllib.parse import urljoin, urlparse
 from pathlib import Path
 
 import requests
 
+from browser_pool import BrowserPool
+from download_manifest import STATUS_DOWNLOADED, STATUS_UNAVAILABLE, DownloadManifest, ManifestEntry
+from downloader import Downloader
 from helpers import setup_logging_levels
+from xml_resolver import SPARQL_ENDPOINT, XmlUrlResolver
+
+
+MANIFEST_FILE = "manifest.sqlite"
+UNAVAILABLE_CONTENT = b'<?xml version="1.0" encoding="UTF-8"?><unavailable/>'
 
 
 def load_from_file(file_path: str):
@@ -19,86 +29,166 @@ def load_from_file(file_path: str):
     return default_value
 
 
-async def extract_xml_url(page_url: str) -> Optional[str]:
-    async with async_playwright() as p:
-        logging.info("launching browser")
-        browser = await p.chromium.launch(headless=True)
-        try:
-            page = await asyncio.wait_for(browser.new_page(), timeout=10)
-        except asyncio.TimeoutError:
-            logging.error("browser failed to start, retrying...")
-            try:
-                page = await asyncio.wait_for(browser.new_page(), timeout=10)
-            except asyncio.TimeoutError:
-                logging.error("second attempt to start browser failed")
-                await browser.close()
-                logging.exception("second attempt to start browser failed")
-                raise ConnectionAbortedError("second attempt to start browser failed")
-        
-        logging.info("browser started")
-
-        # Open the page
-        await page.goto(page_url)
-
-        # Wait for the table to be available in the DOM
-        await page.wait_for_selector('#versionContent')
-        logging.info("page loaded")
-
-        # Find the table row that contains the circle with the soft-green class
-        row = await page.query_selector('table#versionContent tr:has(td > span.circle.soft-green)')
-
-        # If the row is found, locate the XML link in the row and extract the href attribute
-        if row:
-            xml_link = await row.query_selector('a:has-text("XML")')
-            if xml_link:
-                xml_url = await xml_link.get_attribute('href')
-                logging.info(f"extracted XML URL: {xml_url}")
-            else:
-                logging.error("no XML link found in the selected row")
-                xml_url = None
+async def extract_xml_url(page: Page, page_url: str) -> Optional[str]:
+    # Open the page
+    await page.goto(page_url)
+
+    # Wait for the table to be available in the DOM
+    await page.wait_for_selector('#versionContent')
+    logging.info("page loaded")
+
+    # Find the table row that contains the circle with the soft-green class
+    row = await page.query_selector('table#versionContent tr:has(td > span.circle.soft-green)')
+
+    # If the row is found, locate the XML link in the row and extract the href attribute
+    if row:
+        xml_link = await row.query_selector('a:has-text("XML")')
+        if xml_link:
+            xml_url = await xml_link.get_attribute('href')
+            logging.info(f"extracted XML URL: {xml_url}")
         else:
-            logging.error("no row with 'soft-green' circle found")
+            logging.error("no XML link found in the selected row")
             xml_url = None
+    else:
+        logging.error("no row with 'soft-green' circle found")
+        xml_url = None
 
-        await browser.close()
     return xml_url
 
 
-async def task(links_file: str, output_dir: Path):
+async def resolve_xml_url(pool: BrowserPool, resolver: Optional[XmlUrlResolver], url: str) -> Optional[str]:
+    if resolver is not None:
+        try:
+            xml_url = await asyncio.to_thread(resolver.resolve, url)
+            if xml_url:
+                return xml_url
+
+        except (requests.RequestException, ValueError, KeyError):
+            logging.warning("failed to resolve XML URL of %s over HTTP, falling back to browser", url, exc_info=True)
+
+    async with pool.page() as page:
+        return await extract_xml_url(page, url)
+
+
+async def process_url(pool: BrowserPool, resolver: Optional[XmlUrlResolver], downloader: Downloader,
+                      manifest: DownloadManifest, url: str, output_dir: Path) -> None:
+    parsed_url = urlparse(url)
+    eli_path = parsed_url.path[1:]
+    target_path = output_dir.joinpath(eli_path)
+    entry = manifest.get(eli_path)
+
+    logging.info("processing %s to be saved under %s", url, target_path)
+    target_xml_url = await resolve_xml_url(pool, resolver, url)
+    if not target_xml_url:
+        if entry is not None and entry.status == STATUS_DOWNLOADED:
+            logging.warning("no current version found for %s, keeping previously downloaded file", url)
+            return
+
+        target_path.mkdir(parents=True, exist_ok=True)
+        with open(target_path / "unavailable.xml", 'wb') as f:
+            f.write(UNAVAILABLE_CONTENT)
+        manifest.record(ManifestEntry(eli_path, STATUS_UNAVAILABLE, "unavailable.xml", size=len(UNAVAILABLE_CONTENT)))
+        return
+
+    # links from the law page are relative to the site root, resolved ones are absolute
+    xml_url = urljoin(f"{parsed_url.scheme}://{parsed_url.hostname}/", target_xml_url)
+    xml_file_name = xml_url.split('/')[-1]  # Get the last part of the URL as the file name
+    xml_file_path = target_path / xml_file_name
+
+    # validators only apply to the very same file
+    is_same_file = entry is not None and entry.status == STATUS_DOWNLOADED and entry.xml_url == xml_url
+    result = await asyncio.to_thread(downloader.fetch, xml_url, xml_file_path,
+                                     etag=entry.etag if is_same_file else None,
+                                     last_modified=entry.last_modified if is_same_file else None)
+    if result.status == 304:
+        manifest.record(entry._replace(etag=result.etag, last_modified=result.last_modified, fetched_at=None))
+        logging.info("file not modified at %s", xml_file_path)
+
+    elif result.status == 200:
+        # previous versions are replaced, not accumulated
+        if entry is not None and entry.file_name != xml_file_name:
+            (target_path / entry.file_name).unlink(missing_ok=True)
+
+        manifest.record(ManifestEntry(eli_path, STATUS_DOWNLOADED, xml_file_name, xml_url, result.size,
+                                      result.sha256, result.etag, result.last_modified))
+        logging.info("file saved successfully at %s", xml_file_path)
+
+    else:
+        logging.error("failed to download the file (status code: %s)", result.status)
+
+
+def is_up_to_date(entry: Optional[ManifestEntry], refresh: bool, retry_unavailable: bool) -> bool:
+    if entry is None or refresh:
+        return False
+
+    return entry.status != STATUS_UNAVAILABLE or not retry_unavailable
+
+
+async def worker(pool: BrowserPool, resolver: Optional[XmlUrlResolver], downloader: Downloader,
+                 manifest: DownloadManifest, queue: asyncio.Queue, output_dir: Path,
+                 progress: Counter, failed: List[str]) -> None:
+    while True:
+        url = await queue.get()
+        try:
+            await process_url(pool, resolver, downloader, manifest, url, output_dir)
+
+        except (PlaywrightError, asyncio.TimeoutError, ConnectionAbortedError, requests.RequestException):
+            # the pool replaces the broken page, the law will be retried on the next run
+            logging.exception("failed to process %s", url)
+            failed.append(url)
+
+        except Exception:
+            # any other error must not end the worker, or queue.join() would never return
+            logging.exception("unexpected error while processing %s", url)
+            failed.append(url)
+
+        finally:
+            queue.task_done()
+            progress["completed"] += 1
+            if progress["completed"] % 100 == 0:
+                logging.info("%d urls processed, %d remaining", progress["completed"], queue.qsize())
+
+
+async def task(links_file: str, output_dir: Path, count_pages: int, use_browser_only: bool,
+               refresh: bool, retry_unavailable: bool, sparql_endpoint: str = SPARQL_ENDPOINT):
 
     urls = load_from_file(links_file)
-    logging.info("%d urls to be processed", len(urls))
-    
-    count_files = sum(1 for _ in output_dir.rglob('*') if _.is_file())
-    logging.info("%d files already retrieved under %s", count_files, output_dir)
-    
+    logging.info("%d urls in %s", len(urls), links_file)
+
+    manifest = DownloadManifest(output_dir / MANIFEST_FILE)
+    if manifest.count() == 0:
+        manifest.import_tree(output_dir)
+
+    logging.info("%s laws already retrieved under %s (%d bytes)", manifest.stats(), output_dir, manifest.total_size())
+
+    queue = asyncio.Queue()
     for url in urls:
-        parsed_url = urlparse(url)
-        target_path = output_dir.joinpath(parsed_url.path[1:])
-        if target_path.exists():
-            if any(target_path.iterdir()):
-                continue
-
-        logging.info("processing %s to be saved under %s", url, target_path)
-        target_xml_url = await extract_xml_url(url)
-        if target_xml_url:
-            xml_file_name = target_xml_url.split('/')[-1]  # Get the last part of the URL as the file name
-            xml_file_path = target_path / xml_file_name
-            response = requests.get("/".join([parsed_url.scheme + "://" + parsed_url.hostname, target_xml_url]))
-            status = response.status_code
-            content = response.content
-        else:
-            status = 200
-            content = b'<?xml version="1.0" encoding="UTF-8"?><unavailable/>'
-            xml_file_path = target_path / "unavailable.xml"
-        
-        if status == 200:
-            target_path.mkdir(parents=True, exist_ok=True)
-            with open(xml_file_path, 'wb') as f:
-                f.write(content)
-            logging.info("file saved successfully at %s", xml_file_path)
-        else:
-            logging.error("failed to download the file (status code: %s)", response.status_code)
+        if not is_up_to_date(manifest.get(urlparse(url).path[1:]), refresh, retry_unavailable):
+            queue.put_nowait(url)
+
+    logging.info("%d urls to be processed", queue.qsize())
+
+    resolver = None if use_browser_only else XmlUrlResolver(sparql_endpoint, pool_size=count_pages)
+    downloader = Downloader(pool_size=count_pages)
+    progress = Counter()
+    failed = []
+    async with BrowserPool(size=count_pages) as pool:
+        workers = [asyncio.create_task(worker(pool, resolver, downloader, manifest, queue, output_dir, progress, failed))
+                   for _ in range(count_pages)]
+        await queue.join()
+        for running in workers:
+            running.cancel()
+
+        await asyncio.gather(*workers, return_exceptions=True)
+
+    downloader.close()
+    if resolver is not None:
+        resolver.close()
+
+    logging.info("%s laws retrieved under %s (%d bytes)", manifest.stats(), output_dir, manifest.total_size())
+    if failed:
+        logging.warning("%d urls failed, to be retried on the next run, first: %s", len(failed), failed[0])
+    manifest.close()
 
 
 def main():
@@ -109,6 +199,11 @@ def main():
                                      formatter_class=argparse.ArgumentDefaultsHelpFormatter
                                      )
     
+    parser.add_argument('-p', '--pages', type=int, help='Number of browser pages processing laws concurrently', default=4)
+    parser.add_argument('--browser-only', action='store_true', help='Always read XML links from the rendered law page instead of querying Fedlex data over HTTP first')
+    parser.add_argument('--refresh', action='store_true', help='Check already downloaded laws for a newer version, revalidating unchanged files with conditional requests')
+    parser.add_argument('--retry-unavailable', action='store_true', help='Try again laws for which no XML version was found')
+    parser.add_argument('--sparql-endpoint', type=str, help='Fedlex SPARQL endpoint queried for the XML version in force', default=SPARQL_ENDPOINT)
     parser.add_argument("output_dir", type=str, help="Output directory")
 
     args = parser.parse_args()
@@ -116,4 +211,5 @@ def main():
     links_file = f"{args.output_dir}/links.json"
     logging.info("saving downloaded xml files under %s", output_dir)
     output_dir.mkdir(parents=True, exist_ok=True)
-    asyncio.run(task(links_file, output_dir))
+    asyncio.run(task(links_file, output_dir, args.pages, args.browser_only, args.refresh, args.retry_unavailable,
+                     args.sparql_endpoint))
@@ -3,44 +3,66 @@ import logging
 import json
 import os
 import asyncio
-from playwright.async_api import async_playwright
+from typing import Dict
+from urllib.parse import urlparse
 
+from playwright.async_api import Page
+from playwright.async_api import Error as PlaywrightError
+
+from browser_pool import BrowserPool
+from crawl_journal import CrawlJournal
 from helpers import setup_logging_levels
 
 
 # Files for persisting the links
+JOURNAL_FILE = "crawl_journal.jsonl"
+LINKS_FILE = "links.json"
+# Legacy state files, only read when resuming a crawl started without the journal
 TO_BE_PROCESSED_FILE = "to_be_processed_links.json"
 VISITED_LINKS_FILE = "visited_links.json"
-LINKS_FILE = "links.json"
 START_PAGE = "https://www.fedlex.admin.ch/{language_code}/cc/internal-law/{index}"
 
 
-async def extract_urls(page_url: str, language_code: str):
-    async with async_playwright() as p:
-        browser = await p.chromium.launch(headless=True)
-        context = await browser.new_context(
-            java_script_enabled=True,
-            user_agent="Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/94.0.4606.61 Safari/537.36",  # Realistic user agent
-            viewport={"width": 1280, "height": 720},  # Typical viewport size
-            locale="en-US"  # Set the language to US English
-        )
-        await context.add_init_script("""Object.defineProperty(navigator, 'webdriver', { get: () => undefined })""")
-        page = await context.new_page()
-        
-        # Navigate to the target page
-        await page.goto(page_url)
-        await page.wait_for_load_state('networkidle')  # Important - lets javascript execute itself
-        
-        logging.info("loaded page %s", page_url)
-        
-        # Extract all anchor tags and their href attributes
-        links = await page.eval_on_selector_all('#content a', 'elements => elements.map(el => el.href)')
-
-        await browser.close()
-        all_links = {link.split('#')[0] for link in links if not link.endswith("#context-top")}
-        leaf_links = {link for link in all_links if link.endswith(language_code)}
-        node_links = {link for link in all_links if not link.endswith(language_code)}
-        return sorted(leaf_links), sorted(node_links)
+BROWSER_CONTEXT_OPTIONS = {
+    "java_script_enabled": True,
+    "user_agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/94.0.4606.61 Safari/537.36",  # Realistic user agent
+    "viewport": {"width": 1280, "height": 720},  # Typical viewport size
+    "locale": "en-US"  # Set the language to US English
+}
+BROWSER_INIT_SCRIPT = """Object.defineProperty(navigator, 'webdriver', { get: () => undefined })"""
+
+
+async def extract_urls(page: Page, page_url: str, language_code: str):
+    # Navigate to the target page
+    await page.goto(page_url)
+    await page.wait_for_load_state('networkidle')  # Important - lets javascript execute itself
+
+    logging.info("loaded page %s", page_url)
+
+    # Extract all anchor tags and their href attributes
+    links = await page.eval_on_selector_all('#content a', 'elements => elements.map(el => el.href)')
+
+    all_links = {link.split('#')[0] for link in links if not link.endswith("#context-top")}
+    leaf_links = {link for link in all_links if link.endswith(language_code)}
+    node_links = {link for link in all_links if not link.endswith(language_code)}
+    return sorted(leaf_links), sorted(node_links)
+
+
+class HostThrottle:
+    """Spaces out requests sent to the same host by at least `delay` seconds."""
+    def __init__(self, delay: float):
+        self.delay = delay
+        self._next_slot: Dict[str, float] = {}
+
+    async def wait(self, url: str) -> None:
+        if self.delay <= 0:
+            return
+
+        host = urlparse(url).hostname
+        now = asyncio.get_running_loop().time()
+        slot = max(now, self._next_slot.get(host, now))
+        self._next_slot[host] = slot + self.delay
+        await asyncio.sleep(slot - now)
 
 
 # Helper function to load JSON data from a file
@@ -58,44 +80,91 @@ def save_to_file(file_path, data):
         json.dump(data, f, indent=3)
 
 
-async def task(output_dir: str, language: str):
-    # Load the links from files if they exist
-    file_to_be_processed = os.path.sep.join([output_dir, TO_BE_PROCESSED_FILE])
-    file_visited = os.path.sep.join([output_dir, VISITED_LINKS_FILE])
-    file_links = os.path.sep.join([output_dir, LINKS_FILE])
-    initial_links = [START_PAGE.format(language_code=language, index=index) for index in range(1, 10)]
-    to_be_processed_links = load_from_file(file_to_be_processed, initial_links)
-    visited_links = set(load_from_file(file_visited, []))
-    urls = set(load_from_file(file_links, []))
-    
-    while len(to_be_processed_links) > 0:
-        current_link = to_be_processed_links.pop()
-
-        # Process the link (assumed to be an async function that extracts URLs)
-        leaf_links, node_links = await extract_urls(current_link, language_code=language)
-        
-        # Add the current link to visited links
-        visited_links.add(current_link)
-
-        # Persist the updated lists after processing the current link
-        save_to_file(file_to_be_processed, to_be_processed_links)
-        save_to_file(file_visited, list(visited_links))
-
-        # Append new node links to the to-be-processed list if they haven't been visited
-        for link in node_links:
-            if link not in visited_links and link not in to_be_processed_links:
-                to_be_processed_links.append(link)
-
-        # Persist the lists again after adding the new links
-        save_to_file(file_to_be_processed, to_be_processed_links)
-
-        for url in leaf_links:
-            urls.add(url)
-
-        save_to_file(file_links, sorted(list(urls)))
-        logging.info("collected links: %d", len(urls))
-        logging.info("processed pages: %d", len(visited_links))
-        logging.info("remaining pages: %d", len(to_be_processed_links))
+class Crawler:
+    """Walks the internal-law tree with a bounded number of pages processed concurrently.
+
+    Links are deduplicated against visited, queued and in-flight pages, so that each
+    node of the tree is loaded once even when it is reachable from several parents.
+    The crawl state is checkpointed in an append-only journal after each page.
+    """
+    def __init__(self, output_dir: str, language: str, concurrency: int, delay: float):
+        self.language = language
+        self.concurrency = concurrency
+        self.throttle = HostThrottle(delay)
+        self.file_links = os.path.sep.join([output_dir, LINKS_FILE])
+        self.journal = CrawlJournal(os.path.sep.join([output_dir, JOURNAL_FILE]))
+        is_new_journal = not self.journal.exists
+        self.journal.open()
+        if is_new_journal:
+            # picks up state saved before the journal was introduced, if any
+            for link in load_from_file(os.path.sep.join([output_dir, VISITED_LINKS_FILE]), []):
+                self.journal.record(visited=link)
+
+            initial_links = [START_PAGE.format(language_code=language, index=index) for index in range(1, 10)]
+            self.journal.record(queued=load_from_file(os.path.sep.join([output_dir, TO_BE_PROCESSED_FILE]), initial_links),
+                                found=load_from_file(self.file_links, []))
+
+        # queued and in-flight links are the pending links of the journal
+        self.queue = asyncio.Queue()
+        for link in self.journal.pending_links:
+            self.queue.put_nowait(link)
+
+    def is_known(self, link: str) -> bool:
+        return link in self.journal.visited_links or link in self.journal.pending_links
+
+    async def process(self, pool: BrowserPool, current_link: str) -> None:
+        await self.throttle.wait(current_link)
+        async with pool.page() as page:
+            leaf_links, node_links = await extract_urls(page, current_link, language_code=self.language)
+
+        # Queue new node links if they haven't been visited or queued yet
+        new_links = [link for link in node_links if link != current_link and not self.is_known(link)]
+
+        # Checkpoint the processed page
+        self.journal.record(visited=current_link, queued=new_links, found=leaf_links)
+        for link in new_links:
+            self.queue.put_nowait(link)
+
+        logging.info("collected links: %d", len(self.journal.urls))
+        logging.info("processed pages: %d", len(self.journal.visited_links))
+        logging.info("remaining pages: %d", len(self.journal.pending_links))
+
+    async def worker(self, pool: BrowserPool) -> None:
+        while True:
+            current_link = await self.queue.get()
+            try:
+                await self.process(pool, current_link)
+
+            except (PlaywrightError, ConnectionAbortedError):
+                # the link stays pending and is retried on the next run
+                logging.exception("failed to process %s", current_link)
+
+            except Exception:
+                # any other error must not end the worker, or queue.join() would never return
+                logging.exception("unexpected error while processing %s", current_link)
+
+            finally:
+                self.queue.task_done()
+
+    async def run(self) -> None:
+        try:
+            async with BrowserPool(size=self.concurrency,
+                                   context_options=BROWSER_CONTEXT_OPTIONS,
+                                   init_script=BROWSER_INIT_SCRIPT) as pool:
+                workers = [asyncio.create_task(self.worker(pool)) for _ in range(self.concurrency)]
+                await self.queue.join()
+                for running in workers:
+                    running.cancel()
+
+                await asyncio.gather(*workers, return_exceptions=True)
+
+        finally:
+            self.journal.close()
+            save_to_file(self.file_links, sorted(self.journal.urls))
+
+
+async def task(output_dir: str, language: str, concurrency: int, delay: float):
+    await Crawler(output_dir, language, concurrency, delay).run()
 
 
 def main():
@@ -107,10 +176,12 @@ def main():
                                      formatter_class=argparse.ArgumentDefaultsHelpFormatter
                                      )
     
+    parser.add_argument('-c', '--concurrency', type=int, help='Number of pages loaded concurrently', default=4)
+    parser.add_argument('-d', '--delay', type=float, help='Minimum delay in seconds between two requests to the same host', default=0.5)
     parser.add_argument("output_dir", type=str, help="Output directory")
     parser.add_argument("language", type=str, help="One of (de, fr, it)")
 
     args = parser.parse_args()
 
     os.makedirs(args.output_dir, exist_ok=True)
-    asyncio.run(task((args.output_dir, args.language)))
+    asyncio.run(task(args.output_dir, args.language, args.concurrency, args.delay))
@@ -1,18 +1,57 @@
 import argparse
+import logging
 import os
+import time
+from typing import List
 
 import chromadb
+import numpy as np
 
 from embedding import EmbeddingModel
+from embedding_cache import KIND_QUERY, EmbeddingCache
+from exact_search import METRICS, ExactSearchIndex
 from helpers import setup_logging_levels
+from local_embedding import HashingEmbeddingBackend
+from quantized_index import QuantizedIndex
+from vector_dataset import VectorDataset, is_dataset
+
+
+def search_chroma(chromadb_path: str, request_vectors: np.ndarray, k: int) -> List[List[str]]:
+    db_client = chromadb.PersistentClient(
+        path=chromadb_path,
+        settings=chromadb.config.Settings(anonymized_telemetry=False),
+        tenant=chromadb.config.DEFAULT_TENANT,
+        database=chromadb.config.DEFAULT_DATABASE,
+    )
+
+    vectordb = db_client.get_collection(name="swiss_legal_articles")
+    matches = vectordb.query(request_vectors, n_results=k)
+    return matches['documents']
+
+
+def search_exact(dataset_path: str, request_vectors: np.ndarray, k: int, metric: str) -> List[List[str]]:
+    dataset = VectorDataset(dataset_path)
+    index = ExactSearchIndex(dataset.embeddings, metric)
+    positions, _ = index.search(request_vectors, k)
+    documents = dataset.documents_at(positions.ravel().tolist())
+    return [[documents[position]["document"] for position in row] for row in positions.tolist()]
+
+
+def search_quantized(dataset_path: str, index_path: str, request_vectors: np.ndarray, k: int,
+                     candidates: int) -> List[List[str]]:
+    dataset = VectorDataset(dataset_path)
+    index = QuantizedIndex.load(index_path, dataset.embeddings)
+    positions, _ = index.search(request_vectors, k, candidates)
+    documents = dataset.documents_at(positions.ravel().tolist())
+    return [[documents[position]["document"] for position in row] for row in positions.tolist()]
 
 
 def main():
 
     setup_logging_levels()
 
-    usage = """Looking for similar vectors in Chroma DB.
-    Requires environment variable MISTRAL_API_KEY.
+    usage = """Looking for similar vectors in Chroma DB, or exactly in a binary dataset folder.
+    Requires environment variable MISTRAL_API_KEY, unless using the local backend.
     """
     parser = argparse.ArgumentParser(description=usage,
                                      formatter_class=argparse.ArgumentDefaultsHelpFormatter
@@ -20,41 +59,61 @@ def main():
     
     parser.add_argument("-m", "--embedding-model", required=False, default="mistral-embed",
                         action="store", type=str, dest="embedding_model", help="Embedding model")
-    parser.add_argument("chromadb_path", type=str, help="Chroma DB Path")
-    parser.add_argument("request", type=str, help="User request")
+    parser.add_argument('--backend', choices=["mistral", "local"], help='Embeddings from the Mistral API, or computed offline by hashing words', default="mistral")
+    parser.add_argument('--threads', type=int, help='Number of threads of the local backend (all cores by default)')
+    parser.add_argument('--embedding-cache', type=str, help='Embeddings already computed, by model and text hash', default="output/embeddings.cache.sqlite")
+    parser.add_argument('--max-cached-queries', type=int, help='Number of request embeddings kept in cache', default=10000)
+    parser.add_argument('-e', '--engine', choices=["chroma", "exact", "quantized"], help='Approximate search in Chroma DB, exact search over the memory-mapped vectors of a binary dataset, or search in a quantized index of the dataset re-ranked exactly', default="chroma")
+    parser.add_argument('-d', '--distance', choices=METRICS, help='Distance function of the exact engine', default="cosine")
+    parser.add_argument('--quantized-index', type=str, help='Index of build-quantized-index, for the quantized engine (its distance function applies)')
+    parser.add_argument('-c', '--candidates', type=int, help='Candidates of the quantized engine ranked exactly', default=100)
+    parser.add_argument('-k', '--top-k', type=int, help='Number of documents returned per request', default=10)
+    parser.add_argument("chromadb_path", type=str, help="Chroma DB Path, or binary dataset folder with the exact and quantized engines")
+    parser.add_argument("request", type=str, nargs="+", help="User requests, searched together")
 
     args = parser.parse_args()
 
     embedding_api_key = os.environ.get("MISTRAL_API_KEY")
 
+    os.makedirs(os.path.dirname(args.embedding_cache) or ".", exist_ok=True)
+    cache = EmbeddingCache(args.embedding_cache, max_queries=args.max_cached_queries)
     embedding_model = EmbeddingModel(
         model_deployment=args.embedding_model,
         api_key=embedding_api_key,
-        batch_size=1
+        batch_size=1,
+        cache=cache,
+        backend=HashingEmbeddingBackend(workers=args.threads) if args.backend == "local" else None
     )
 
-    # Vector database/Search index
-    db_client = chromadb.PersistentClient(
-        path=args.chromadb_path,
-        settings=chromadb.config.Settings(anonymized_telemetry=False),
-        tenant=chromadb.config.DEFAULT_TENANT,
-        database=chromadb.config.DEFAULT_DATABASE,
-    )
-    
-    vectordb = db_client.get_collection(name="swiss_legal_articles")
-    
-    embedding_response = embedding_model.embed([args.request])
-    if len(embedding_response) != 1:
+    if args.engine != "chroma" and not is_dataset(args.chromadb_path):
+        parser.error(f"{args.chromadb_path} is not a binary dataset folder, see convert-vectors")
+    if args.engine == "quantized" and not args.quantized_index:
+        parser.error("the quantized engine requires --quantized-index")
+
+    embedding_response = embedding_model.embed_documents(args.request, kind=KIND_QUERY).vectors
+    cache.close()
+    if len(embedding_response) != len(args.request) or any(vector is None for vector in embedding_response):
         raise RuntimeError(f"returned inconsistent embedding: {embedding_response}")
-    
-    request_vector = embedding_response[0]
 
-    print(f"request vector size: {len(request_vector)}")
-    
-    matches = vectordb.query(request_vector, n_results=10)
-    for doc in matches['documents'][0]:
-        print(doc)
-        print("----------------------------")
+    request_vectors = np.asarray(embedding_response, dtype=np.float32)
+
+    print(f"request vector size: {request_vectors.shape[1]}")
+
+    start = time.perf_counter()
+    if args.engine == "exact":
+        results = search_exact(args.chromadb_path, request_vectors, args.top_k, args.distance)
+    elif args.engine == "quantized":
+        results = search_quantized(args.chromadb_path, args.quantized_index, request_vectors, args.top_k, args.candidates)
+    else:
+        results = search_chroma(args.chromadb_path, request_vectors, args.top_k)
+    logging.info("searched %d requests in %.1f ms", len(args.request), (time.perf_counter() - start) * 1000)
+
+    for request, documents in zip(args.request, results):
+        if len(args.request) > 1:
+            print(f"=== {request}")
+        for doc in documents:
+            print(doc)
+            print("----------------------------")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,156 @@
+"""
+Local stand-in for the Mistral embeddings endpoint, for exercising generate-vectors without an API key.
+
+Vectors are derived from a hash of each input, so that identical texts get identical vectors. Requests
+above the configured rate are answered with 429 and a Retry-After header, like the real API, and requests
+with too many tokens with 400.
+"""
+import argparse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import hashlib
+import json
+import logging
+import math
+import random
+import threading
+import time
+from typing import List
+
+from helpers import setup_logging_levels
+
+
+BYTES_PER_TOKEN = 4
+
+
+def count_tokens(text: str) -> int:
+    return len(text.encode("utf-8")) // BYTES_PER_TOKEN + 1
+
+
+def stand_in_vector(text: str, dimension: int) -> List[float]:
+    rng = random.Random(hashlib.sha256(text.encode("utf-8")).digest())
+    vector = [rng.gauss(0., 1.) for _ in range(dimension)]
+    norm = math.sqrt(sum(value * value for value in vector))
+    return [value / norm for value in vector]
+
+
+class RateLimit:
+    """Fixed one-second windows of at most `requests_per_second` requests."""
+    def __init__(self, requests_per_second: int):
+        self.requests_per_second = requests_per_second
+        self._lock = threading.Lock()
+        self._window = 0
+        self._count = 0
+
+    def allow(self) -> float:
+        """Returns 0 when the request is allowed, otherwise the number of seconds until the next window."""
+        with self._lock:
+            now = time.monotonic()
+            if int(now) != self._window:
+                self._window = int(now)
+                self._count = 0
+            if self._count >= self.requests_per_second:
+                return self._window + 1 - now
+            self._count += 1
+            return 0.
+
+
+class EmbeddingsHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    dimension = 1024
+    latency = 0.
+    max_input_tokens = 8192
+    max_request_tokens = 16384
+    reject_marker = None
+    rate_limit: RateLimit = None
+    count_requests = 0
+    count_rate_limited = 0
+
+    def send_json(self, status: int, payload: dict, headers: dict = None) -> None:
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        if self.path.rstrip("/") != "/v1/embeddings":
+            self.send_json(404, {"message": f"unknown path {self.path}"})
+            return
+
+        EmbeddingsHandler.count_requests += 1
+        wait = self.rate_limit.allow() if self.rate_limit else 0.
+        if wait > 0:
+            EmbeddingsHandler.count_rate_limited += 1
+            self.send_json(429, {"message": "Requests rate limit exceeded"}, {"Retry-After": str(math.ceil(wait))})
+            return
+
+        inputs = request.get("input", [])
+        inputs = [inputs] if isinstance(inputs, str) else inputs
+        tokens = [count_tokens(text) for text in inputs]
+        for index, text in enumerate(inputs):
+            if tokens[index] > self.max_input_tokens:
+                self.send_json(400, {"message": f"Input id {index} has {tokens[index]} tokens, exceeding max {self.max_input_tokens} tokens."})
+                return
+            if self.reject_marker and self.reject_marker in text:
+                self.send_json(400, {"message": f"Input id {index} is invalid."})
+                return
+        if sum(tokens) > self.max_request_tokens:
+            self.send_json(400, {"message": "Too many tokens overall, split into more batches."})
+            return
+
+        time.sleep(self.latency)
+        self.send_json(200, {
+            "id": hashlib.md5(json.dumps(inputs).encode("utf-8")).hexdigest(),
+            "object": "list",
+            "model": request.get("model", "mistral-embed"),
+            "usage": {"prompt_tokens": sum(tokens), "total_tokens": sum(tokens), "completion_tokens": 0},
+            "data": [{"object": "embedding", "embedding": stand_in_vector(text, self.dimension), "index": index}
+                     for index, text in enumerate(inputs)]
+        })
+
+    def log_message(self, format, *args):
+        logging.debug(format, *args)
+
+
+def main():
+
+    setup_logging_levels()
+
+    usage = """Serving stand-in embeddings on /v1/embeddings, to be used as --server-url of generate-vectors."""
+    parser = argparse.ArgumentParser(description=usage,
+                                     formatter_class=argparse.ArgumentDefaultsHelpFormatter
+                                     )
+    parser.add_argument('--host', type=str, help='Listening address', default="127.0.0.1")
+    parser.add_argument('--port', type=int, help='Listening port', default=8765)
+    parser.add_argument('--dimension', type=int, help='Size of returned vectors', default=1024)
+    parser.add_argument('--latency', type=float, help='Processing time of each request in seconds', default=0.2)
+    parser.add_argument('--rate', type=int, help='Requests per second before answering 429 (0 for unlimited)', default=6)
+    parser.add_argument('--max-input-tokens', type=int, help='Tokens allowed per input', default=8192)
+    parser.add_argument('--max-request-tokens', type=int, help='Tokens allowed per request', default=16384)
+    parser.add_argument('--reject-marker', type=str, help='Inputs containing this text are refused with 400')
+    args = parser.parse_args()
+
+    EmbeddingsHandler.dimension = args.dimension
+    EmbeddingsHandler.latency = args.latency
+    EmbeddingsHandler.max_input_tokens = args.max_input_tokens
+    EmbeddingsHandler.max_request_tokens = args.max_request_tokens
+    EmbeddingsHandler.reject_marker = args.reject_marker
+    EmbeddingsHandler.rate_limit = RateLimit(args.rate) if args.rate > 0 else None
+    server = ThreadingHTTPServer((args.host, args.port), EmbeddingsHandler)
+    logging.info("serving stand-in embeddings on http://%s:%d", args.host, args.port)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        logging.info("served %d requests, %d rate limited", EmbeddingsHandler.count_requests,
+                     EmbeddingsHandler.count_rate_limited)
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,144 @@
+"""
+Generates synthetic Akoma Ntoso corpora shaped like Fedlex downloads, for measuring parsing offline.
+
+Documents reuse the metadata, preface and closing parts of the sample fedlex-*.xml files, their
+sentences as text material, and hierarchy elements from the ANhier group of akomantoso30.xsd.
+"""
+import argparse
+import glob
+import logging
+import os
+import random
+from typing import List, NamedTuple
+from xml.sax.saxutils import escape
+import xml.etree.ElementTree as ET
+
+from generate_documents import NAMESPACES, get_full_text, single_line
+from helpers import setup_logging_levels
+
+
+XSD_NAMESPACES = {"xsd": "http://www.w3.org/2001/XMLSchema"}
+# elements of the legislative hierarchy found below articles rather than above
+SUB_ARTICLE_ELEMENTS = {"article", "paragraph", "subparagraph", "list", "point", "indent", "alinea", "clause",
+                        "subclause", "sublist", "rule", "subrule", "proviso", "transitional"}
+
+
+class CorpusProfile(NamedTuple):
+    """Shape of the documents of a synthetic corpus."""
+    name: str
+    count_files: int
+    count_items: int  # articles, or leaf levels for level-only documents
+    depth: int
+    paragraphs: int  # paragraphs per article
+    sentences: int  # sentences per paragraph
+    with_articles: bool = True
+
+
+PROFILES = {
+    "articles": CorpusProfile("articles", count_files=200, count_items=60, depth=3, paragraphs=3, sentences=2),
+    "levels": CorpusProfile("levels", count_files=200, count_items=60, depth=3, paragraphs=3, sentences=2, with_articles=False),
+    "deep": CorpusProfile("deep", count_files=50, count_items=200, depth=25, paragraphs=2, sentences=2),
+    "huge-articles": CorpusProfile("huge-articles", count_files=20, count_items=10, depth=1, paragraphs=300, sentences=5),
+    "large-codes": CorpusProfile("large-codes", count_files=5, count_items=3000, depth=5, paragraphs=3, sentences=3),
+}
+
+
+class Templates:
+    """Material taken from the sample documents and the Akoma Ntoso schema."""
+    def __init__(self, resources_folder: str):
+        samples = sorted(glob.glob(os.path.join(resources_folder, "fedlex-*.xml")))
+        if not samples:
+            raise FileNotFoundError(f"no fedlex-*.xml sample found in {resources_folder}")
+
+        self.frames = []
+        self.sentences = []
+        for sample in samples:
+            with open(sample, encoding="utf-8") as f:
+                content = f.read()
+            start = content.index("<body>") + len("<body>")
+            end = content.index("</body>")
+            self.frames.append((content[:start], content[end:]))
+            body = ET.fromstring(content).find("akn:act/akn:body", NAMESPACES)
+            self.sentences += [single_line(get_full_text(p)) for p in body.iter(f"{{{NAMESPACES['akn']}}}p")]
+
+        self.sentences = [escape(sentence) for sentence in self.sentences if sentence]
+        schema = ET.parse(os.path.join(resources_folder, "akomantoso30.xsd")).getroot()
+        hierarchy = schema.find("xsd:group[@name='ANhier']/xsd:choice", XSD_NAMESPACES)
+        self.containers = [element.get("ref") for element in hierarchy.findall("xsd:element", XSD_NAMESPACES)
+                           if element.get("ref") not in SUB_ARTICLE_ELEMENTS]
+
+
+def synthetic_document(templates: Templates, profile: CorpusProfile, seed: int = 0) -> str:
+    """Builds a document with the articles (or leaf levels) of `profile` nested `profile.depth` levels deep."""
+    rng = random.Random(seed)
+    header, footer = rng.choice(templates.frames)
+
+    def paragraph(article_index: int, index: int) -> str:
+        text = " ".join(rng.choice(templates.sentences) for _ in range(profile.sentences))
+        return (f'<paragraph eId="art_{article_index}/para_{index}"><num>{index}</num>'
+                f'<content><p>{text}</p></content></paragraph>')
+
+    def item(index: int) -> str:
+        tag = "article" if profile.with_articles else "level"
+        paragraphs = "".join(paragraph(index, i + 1) for i in range(rng.randint(1, profile.paragraphs)))
+        return (f'<{tag} eId="art_{index}"><num><b>Art. {index}</b></num>'
+                f'<heading>{rng.choice(templates.sentences)[:80]}</heading>{paragraphs}</{tag}>')
+
+    def hierarchy(level: int, first: int, count: int) -> str:
+        if level == profile.depth or count <= 1:
+            return "".join(item(first + i) for i in range(count))
+
+        tag = rng.choice(templates.containers) if profile.with_articles else "level"
+        count_children = min(count, rng.randint(1, 4))
+        size = count // count_children
+        children = [hierarchy(level + 1, first + i * size, size if i < count_children - 1 else count - i * size)
+                    for i in range(count_children)]
+        return (f'<{tag} eId="{tag}_{level}_{first}"><num>{tag.capitalize()} {first}</num>'
+                f'<heading>{rng.choice(templates.sentences)[:60]}</heading>{"".join(children)}</{tag}>')
+
+    return header + hierarchy(0, 1, profile.count_items) + footer
+
+
+def generate_corpus(templates: Templates, profile: CorpusProfile, output_folder: str, seed: int = 0) -> List[str]:
+    """Writes the documents of `profile` under `output_folder` laid out like load-laws downloads."""
+    paths = []
+    for index in range(profile.count_files):
+        folder = os.path.join(output_folder, "eli", "cc", profile.name, str(index), "fr")
+        os.makedirs(folder, exist_ok=True)
+        path = os.path.join(folder, f"synthetic-{profile.name}-{index}-fr-xml.xml")
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(synthetic_document(templates, profile, seed=seed + index))
+        paths.append(path)
+
+    return paths
+
+
+def main():
+
+    setup_logging_levels()
+
+    usage = """Generating a synthetic corpus of Akoma Ntoso documents."""
+    parser = argparse.ArgumentParser(description=usage,
+                                     formatter_class=argparse.ArgumentDefaultsHelpFormatter
+                                     )
+    parser.add_argument('-p', '--profile', choices=list(PROFILES), help='Predefined document shape', default="articles")
+    parser.add_argument('-f', '--files', type=int, help='Number of documents (overrides profile)')
+    parser.add_argument('-n', '--articles', type=int, help='Number of articles per document (overrides profile)')
+    parser.add_argument('-d', '--depth', type=int, help='Nesting depth of articles (overrides profile)')
+    parser.add_argument('--paragraphs', type=int, help='Maximum number of paragraphs per article (overrides profile)')
+    parser.add_argument('--seed', type=int, help='Random seed', default=0)
+    parser.add_argument('-r', '--resources', type=str, help='Folder with akomantoso30.xsd and sample fedlex-*.xml documents', default="resources")
+    parser.add_argument("output_folder", type=str, help="Directory where documents are saved")
+    args = parser.parse_args()
+
+    profile = PROFILES[args.profile]
+    profile = profile._replace(count_files=args.files or profile.count_files,
+                               count_items=args.articles or profile.count_items,
+                               depth=args.depth if args.depth is not None else profile.depth,
+                               paragraphs=args.paragraphs or profile.paragraphs)
+    paths = generate_corpus(Templates(args.resources), profile, args.output_folder, seed=args.seed)
+    logging.info("generated %d documents under %s", len(paths), args.output_folder)
+
+
+if __name__ == "__main__":
+    main()
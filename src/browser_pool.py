@@ -0,0 +1,168 @@
+import asyncio
+import logging
+import time
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Dict, Optional
+
+from playwright.async_api import Browser, BrowserContext, Page, Playwright, async_playwright
+from playwright.async_api import Error as PlaywrightError
+
+
+class _Slot:
+    """A browser context with a single page, handed out to one worker at a time."""
+    def __init__(self, context: BrowserContext, page: Page, generation: int):
+        self.context = context
+        self.page = page
+        self.generation = generation
+        self.uses = 0
+        self.crashed = False
+
+
+class BrowserPool:
+    """Long-lived headless Chromium serving a fixed number of recycled pages.
+
+    The browser is launched on first use and shared by `size` contexts, each holding one page.
+    Pages are given back to the pool after use and their context is recreated after
+    `max_uses` navigations, after a crash or when the browser itself went away.
+    """
+    def __init__(self, size: int = 4, max_uses: int = 100, start_timeout: float = 10,
+                 context_options: Optional[Dict] = None, init_script: Optional[str] = None):
+        self.size = size
+        self.max_uses = max_uses
+        self.start_timeout = start_timeout
+        self.context_options = context_options or {}
+        self.init_script = init_script
+        self._playwright: Optional[Playwright] = None
+        self._browser: Optional[Browser] = None
+        self._generation = 0
+        self._launch_lock = asyncio.Lock()
+        self._slots: asyncio.Queue = asyncio.Queue()
+        self._started_at = None
+        self.count_pages = 0
+        self.count_failures = 0
+
+    async def __aenter__(self) -> "BrowserPool":
+        await self.start()
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        await self.close()
+
+    async def start(self) -> None:
+        self._playwright = await async_playwright().start()
+        for _ in range(self.size):
+            self._slots.put_nowait(None)  # slots are created lazily on first use
+
+        self._started_at = time.monotonic()
+
+    async def close(self) -> None:
+        self.log_stats()
+        if self._browser is not None:
+            await self._browser.close()
+            self._browser = None
+
+        if self._playwright is not None:
+            await self._playwright.stop()
+            self._playwright = None
+
+    @property
+    def is_connected(self) -> bool:
+        return self._browser is not None and self._browser.is_connected()
+
+    async def _launch(self) -> None:
+        logging.info("launching browser")
+        self._browser = await self._playwright.chromium.launch(headless=True)
+        self._generation += 1
+
+    async def _relaunch_if_needed(self, generation: int) -> None:
+        async with self._launch_lock:
+            # another worker may already have replaced the browser
+            if self._generation == generation and not self.is_connected:
+                if self._browser is not None:
+                    logging.error("browser disconnected, relaunching")
+                await self._launch()
+
+    async def _new_slot(self) -> _Slot:
+        for attempt in range(2):
+            generation = self._generation
+            if not self.is_connected:
+                await self._relaunch_if_needed(generation)
+                generation = self._generation
+
+            try:
+                context = await asyncio.wait_for(self._browser.new_context(**self.context_options),
+                                                 timeout=self.start_timeout)
+                if self.init_script:
+                    await context.add_init_script(self.init_script)
+
+                page = await asyncio.wait_for(context.new_page(), timeout=self.start_timeout)
+
+            except (asyncio.TimeoutError, PlaywrightError):
+                logging.exception("failed to open browser page (attempt %d)", attempt + 1)
+                await self._relaunch_if_needed(generation)
+                continue
+
+            slot = _Slot(context, page, generation)
+            page.on("crash", lambda _: setattr(slot, "crashed", True))
+            return slot
+
+        raise ConnectionAbortedError("unable to open browser page")
+
+    @staticmethod
+    async def _discard(slot: Optional[_Slot]) -> None:
+        if slot is None:
+            return
+
+        try:
+            await slot.context.close()
+
+        except PlaywrightError:
+            logging.debug("context already closed")
+
+    def _is_usable(self, slot: Optional[_Slot]) -> bool:
+        return (slot is not None
+                and not slot.crashed
+                and not slot.page.is_closed()
+                and slot.generation == self._generation
+                and slot.uses < self.max_uses)
+
+    @asynccontextmanager
+    async def page(self) -> AsyncIterator[Page]:
+        """Borrows a page from the pool, recycling its context when it is worn out or broken."""
+        slot = await self._slots.get()
+        try:
+            if not self._is_usable(slot):
+                await self._discard(slot)
+                slot = None
+                slot = await self._new_slot()
+
+            slot.uses += 1
+            try:
+                yield slot.page
+
+            except PlaywrightError:
+                # crashed or hung pages are not handed out again
+                self.count_failures += 1
+                slot.crashed = True
+                if not self.is_connected:
+                    await self._relaunch_if_needed(slot.generation)
+
+                raise
+
+            self.count_pages += 1
+            if self.count_pages % 100 == 0:
+                self.log_stats()
+
+        finally:
+            self._slots.put_nowait(slot)
+
+    @property
+    def pages_per_second(self) -> float:
+        if self._started_at is None:
+            return 0.
+        elapsed = time.monotonic() - self._started_at
+        return self.count_pages / elapsed if elapsed > 0 else 0.
+
+    def log_stats(self) -> None:
+        logging.info("browser pool: %d pages processed (%d failures), %.2f pages/sec",
+                     self.count_pages, self.count_failures, self.pages_per_second)
@@ -0,0 +1,112 @@
+import json
+import logging
+import os
+from typing import Iterable, Set
+
+
+class CrawlJournal:
+    """Append-only record of the crawl state, replayed into sets on startup.
+
+    Each processed page is checkpointed as a single JSON line holding the visited link,
+    the node links it queued and the leaf links it found. A line torn by a crash mid-write
+    is dropped on the next start, in which case the page is simply visited again.
+    The journal is periodically compacted into a snapshot of the current state.
+    """
+    def __init__(self, file_path: str, compact_every: int = 5000):
+        self.file_path = file_path
+        self.compact_every = compact_every
+        self.pending_links: Set[str] = set()
+        self.visited_links: Set[str] = set()
+        self.urls: Set[str] = set()
+        self._count_appended = 0
+        self._file = None
+
+    def __enter__(self) -> "CrawlJournal":
+        self.open()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    @property
+    def exists(self) -> bool:
+        return os.path.exists(self.file_path)
+
+    def _apply(self, record) -> None:
+        self.urls.update(record.get("found", []))
+        for link in record.get("queued", []):
+            if link not in self.visited_links:
+                self.pending_links.add(link)
+
+        visited = record.get("visited")
+        if visited is not None:
+            self.visited_links.add(visited)
+            self.pending_links.discard(visited)
+
+    def _replay(self) -> None:
+        valid_size = 0
+        with open(self.file_path, "rb") as f:
+            for line in f:
+                try:
+                    if not line.endswith(b"\n"):
+                        raise ValueError("incomplete record")
+                    record = json.loads(line)
+
+                except ValueError:
+                    logging.warning("dropping corrupted journal record at offset %d in %s", valid_size, self.file_path)
+                    break
+
+                self._apply(record)
+                self._count_appended += 1
+                valid_size += len(line)
+
+        if valid_size < os.path.getsize(self.file_path):
+            with open(self.file_path, "r+b") as f:
+                f.truncate(valid_size)
+
+    def open(self) -> None:
+        if self.exists:
+            logging.info("replaying %s", self.file_path)
+            self._replay()
+
+        self._file = open(self.file_path, "a", encoding="utf-8")
+
+    def close(self) -> None:
+        if self._file is not None:
+            self.compact()
+            self._file.close()
+            self._file = None
+
+    def record(self, visited: str = None, queued: Iterable[str] = (), found: Iterable[str] = ()) -> None:
+        """Checkpoints a processed page in a single appended line."""
+        record = {}
+        if visited is not None:
+            record["visited"] = visited
+        if queued:
+            record["queued"] = list(queued)
+        if found:
+            record["found"] = list(found)
+
+        self._apply(record)
+        self._file.write(json.dumps(record) + "\n")
+        self._file.flush()
+        self._count_appended += 1
+        # compacting no more often than the snapshot size keeps the amortized cost per page constant
+        if self._count_appended >= max(self.compact_every, len(self.visited_links)):
+            self.compact()
+
+    def compact(self) -> None:
+        """Rewrites the journal as a snapshot of the current state, atomically replacing the old one."""
+        temp_path = self.file_path + ".tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            for link in sorted(self.visited_links):
+                f.write(json.dumps({"visited": link}) + "\n")
+            f.write(json.dumps({"queued": sorted(self.pending_links), "found": sorted(self.urls)}) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+        self._file.close()
+        os.replace(temp_path, self.file_path)
+        self._file = open(self.file_path, "a", encoding="utf-8")
+        self._count_appended = 0
+        logging.info("compacted %s", self.file_path)
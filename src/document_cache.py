@@ -0,0 +1,95 @@
+import hashlib
+import json
+import os
+import sqlite3
+import zlib
+from typing import Dict, List, NamedTuple, Optional, Set
+
+
+class CachedDocument(NamedTuple):
+    doc_url: str
+    size: int
+    mtime_ns: int
+    sha256: str
+    lines: List[str]
+
+
+def file_sha256(file_path: str) -> str:
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class DocumentCache:
+    """SQLite store of the json lines extracted from each source document, keyed by its doc_url.
+
+    Entries are valid as long as the content hash of the source file is unchanged. The hash
+    is only computed again when the size or modification time of the file changed.
+    """
+    def __init__(self, file_path: str):
+        self.file_path = file_path
+        self._connection = sqlite3.connect(file_path)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        self._connection.execute("""CREATE TABLE IF NOT EXISTS documents (
+            doc_url TEXT PRIMARY KEY,
+            size INTEGER NOT NULL,
+            mtime_ns INTEGER NOT NULL,
+            sha256 TEXT NOT NULL,
+            lines BLOB NOT NULL
+        )""")
+        self._connection.commit()
+
+    def close(self) -> None:
+        self._connection.commit()
+        self._connection.close()
+
+    def doc_urls(self) -> List[str]:
+        return [row[0] for row in self._connection.execute("SELECT doc_url FROM documents")]
+
+    def get(self, doc_url: str) -> Optional[CachedDocument]:
+        row = self._connection.execute("SELECT doc_url, size, mtime_ns, sha256, lines FROM documents WHERE doc_url = ?",
+                                       (doc_url,)).fetchone()
+        if row is None:
+            return None
+
+        return CachedDocument(*row[:4], zlib.decompress(row[4]).decode("utf-8").splitlines(keepends=True))
+
+    def is_fresh(self, doc_url: str, file_path: str) -> bool:
+        """Tells whether the cached lines of a document were extracted from the current content of its source file."""
+        row = self._connection.execute("SELECT size, mtime_ns, sha256 FROM documents WHERE doc_url = ?",
+                                       (doc_url,)).fetchone()
+        if row is None:
+            return False
+
+        size, mtime_ns, sha256 = row
+        stat = os.stat(file_path)
+        if stat.st_size == size and stat.st_mtime_ns == mtime_ns:
+            return True
+
+        if stat.st_size == size and file_sha256(file_path) == sha256:
+            # touched but identical
+            self._connection.execute("UPDATE documents SET mtime_ns = ? WHERE doc_url = ?", (stat.st_mtime_ns, doc_url))
+            return True
+
+        return False
+
+    def put(self, doc_url: str, file_path: str, lines: List[str]) -> None:
+        stat = os.stat(file_path)
+        self._connection.execute("INSERT OR REPLACE INTO documents (doc_url, size, mtime_ns, sha256, lines) VALUES (?, ?, ?, ?, ?)",
+                                 (doc_url, stat.st_size, stat.st_mtime_ns, file_sha256(file_path),
+                                  zlib.compress("".join(lines).encode("utf-8"))))
+
+    def delete(self, doc_url: str) -> None:
+        self._connection.execute("DELETE FROM documents WHERE doc_url = ?", (doc_url,))
+
+    def commit(self) -> None:
+        self._connection.commit()
+
+
+def add_records(records: Dict[str, Set[str]], lines: List[str]) -> None:
+    """Adds to `records` the hash of each line under its uid, a uid being produced by one or more documents."""
+    for line in lines:
+        records.setdefault(json.loads(line)["uid"], set()).add(hashlib.md5(line.encode("utf-8")).hexdigest())
@@ -0,0 +1,91 @@
+import datetime
+import logging
+import os
+import sqlite3
+from pathlib import Path
+from typing import Dict, NamedTuple, Optional
+
+
+STATUS_DOWNLOADED = "downloaded"
+STATUS_UNAVAILABLE = "unavailable"
+
+
+class ManifestEntry(NamedTuple):
+    eli_path: str
+    status: str
+    file_name: str
+    xml_url: Optional[str] = None
+    size: Optional[int] = None
+    sha256: Optional[str] = None
+    etag: Optional[str] = None
+    last_modified: Optional[str] = None
+    fetched_at: Optional[str] = None
+
+
+class DownloadManifest:
+    """SQLite index of the downloaded laws, keyed by ELI path (e.g. eli/cc/27/317_321_377/fr).
+
+    Resuming and refreshing a download only query the index, so that the output tree
+    is never walked or listed.
+    """
+    def __init__(self, file_path: Path):
+        self.file_path = file_path
+        self._connection = sqlite3.connect(file_path)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        self._connection.execute("""CREATE TABLE IF NOT EXISTS laws (
+            eli_path TEXT PRIMARY KEY,
+            status TEXT NOT NULL,
+            file_name TEXT NOT NULL,
+            xml_url TEXT,
+            size INTEGER,
+            sha256 TEXT,
+            etag TEXT,
+            last_modified TEXT,
+            fetched_at TEXT
+        )""")
+        self._connection.commit()
+
+    def close(self) -> None:
+        self._connection.close()
+
+    def get(self, eli_path: str) -> Optional[ManifestEntry]:
+        row = self._connection.execute(f"SELECT {', '.join(ManifestEntry._fields)} FROM laws WHERE eli_path = ?",
+                                       (eli_path,)).fetchone()
+        return ManifestEntry(*row) if row else None
+
+    def record(self, entry: ManifestEntry) -> None:
+        if entry.fetched_at is None:
+            entry = entry._replace(fetched_at=datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds"))
+
+        self._connection.execute(f"INSERT OR REPLACE INTO laws ({', '.join(ManifestEntry._fields)}) "
+                                 f"VALUES ({', '.join('?' * len(ManifestEntry._fields))})", entry)
+        self._connection.commit()
+
+    def count(self) -> int:
+        return self._connection.execute("SELECT COUNT(*) FROM laws").fetchone()[0]
+
+    def stats(self) -> Dict[str, int]:
+        return dict(self._connection.execute("SELECT status, COUNT(*) FROM laws GROUP BY status"))
+
+    def total_size(self) -> int:
+        return self._connection.execute("SELECT COALESCE(SUM(size), 0) FROM laws").fetchone()[0]
+
+    def import_tree(self, output_dir: Path) -> None:
+        """Indexes files downloaded before the manifest existed, walking the output tree once."""
+        count_entries = 0
+        for dirpath, _, filenames in os.walk(output_dir):
+            xml_files = [name for name in filenames if name.endswith(".xml")]
+            if not xml_files:
+                continue
+
+            eli_path = Path(dirpath).relative_to(output_dir).as_posix()
+            file_name = next((name for name in xml_files if name != "unavailable.xml"), xml_files[0])
+            status = STATUS_UNAVAILABLE if file_name == "unavailable.xml" else STATUS_DOWNLOADED
+            self._connection.execute(
+                "INSERT OR REPLACE INTO laws (eli_path, status, file_name, size) VALUES (?, ?, ?, ?)",
+                (eli_path, status, file_name, os.path.getsize(os.path.join(dirpath, file_name))))
+            count_entries += 1
+
+        self._connection.commit()
+        logging.info("indexed %d previously downloaded laws from %s", count_entries, output_dir)
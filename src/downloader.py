@@ -0,0 +1,91 @@
+import hashlib
+import logging
+import os
+import tempfile
+from pathlib import Path
+from typing import NamedTuple, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+
+# read once, setting the umask being process-wide: mode of downloaded files, as if created with open()
+UMASK = os.umask(0)
+os.umask(UMASK)
+FILE_MODE = 0o666 & ~UMASK
+
+
+class FetchResult(NamedTuple):
+    status: int
+    etag: Optional[str] = None
+    last_modified: Optional[str] = None
+    size: Optional[int] = None
+    sha256: Optional[str] = None
+
+
+class Downloader:
+    """Downloads files over a shared keep-alive session, with retries and revalidation.
+
+    Bodies are streamed to a temporary file in the target directory, which is renamed
+    over the target only once complete, so that an interrupted download never leaves
+    a truncated file behind. When validators from a previous download are given,
+    the request is conditional and an unchanged file costs a 304 response.
+    """
+    def __init__(self, pool_size: int = 10, timeout: float = 60, retries: int = 3,
+                 backoff_factor: float = 0.5, chunk_size: int = 64 * 1024):
+        self.timeout = timeout
+        self.chunk_size = chunk_size
+        self.session = requests.Session()
+        retry = Retry(total=retries, backoff_factor=backoff_factor,
+                      status_forcelist=[429, 500, 502, 503, 504], allowed_methods=["GET"])
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def close(self) -> None:
+        self.session.close()
+
+    def fetch(self, url: str, target_file: Path, etag: Optional[str] = None,
+              last_modified: Optional[str] = None) -> FetchResult:
+        """Downloads `url` into `target_file` unless it is unchanged since the given validators.
+
+        Raises:
+            requests.RequestException: the download failed after retries
+        """
+        headers = {}
+        if etag:
+            headers["If-None-Match"] = etag
+        if last_modified:
+            headers["If-Modified-Since"] = last_modified
+
+        with self.session.get(url, headers=headers, stream=True, timeout=self.timeout) as response:
+            if response.status_code == 304:
+                return FetchResult(304, response.headers.get("ETag", etag),
+                                   response.headers.get("Last-Modified", last_modified))
+
+            if response.status_code != 200:
+                return FetchResult(response.status_code)
+
+            target_file.parent.mkdir(parents=True, exist_ok=True)
+            digest = hashlib.sha256()
+            size = 0
+            fd, temp_path = tempfile.mkstemp(dir=target_file.parent, prefix=".", suffix=".part")
+            try:
+                with os.fdopen(fd, "wb") as f:
+                    for chunk in response.iter_content(chunk_size=self.chunk_size):
+                        f.write(chunk)
+                        digest.update(chunk)
+                        size += len(chunk)
+
+                # mkstemp creates the file readable by its owner only
+                os.chmod(temp_path, FILE_MODE)
+                os.replace(temp_path, target_file)
+
+            except BaseException:
+                os.unlink(temp_path)
+                raise
+
+            logging.debug("downloaded %d bytes from %s", size, url)
+            return FetchResult(200, response.headers.get("ETag"), response.headers.get("Last-Modified"),
+                               size, digest.hexdigest())
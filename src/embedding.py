@@ -4,64 +4,70 @@
         _type_: _description_
 """
 import logging
-import sys
-import time
-from typing import List
+from typing import Dict, List, Optional
 
-from chromadb import EmbeddingFunction
+import numpy as np
 
-from mistralai import Mistral, SDKError
+from embedding_backend import EmbeddingBackend, MistralBackend
+from embedding_cache import KIND_DOCUMENT, EmbeddingCache, text_hash
+from embedding_engine import MAX_TOKENS_PER_REQUEST, EmbeddingResult
 
 
 MAX_NUMBER_DOCS = 41666  # ChromaDB limit
 
 
-class MistralEmbeddingFunction(EmbeddingFunction):
-    """_summary_
-
-    Args:
-        EmbeddingFunction (_type_): _description_
-    """
-    def __init__(self, api_key: str, model_deployment: str):
-        self._client = Mistral(api_key=api_key)
-        self._model = model_deployment
-
-    def __call__(self, documents: List[str]) -> List[float]:
-        retries = 5
-        backoff_factor = 0.3
-
-        for attempt in range(retries):
-            try:
-                resp = self._client.embeddings.create(model=self._model, inputs=documents)
-                if resp is not None:
-                    return [d.embedding for d in resp.data]
-            except SDKError as e:
-                if e.status_code == 429:
-                    wait_time = backoff_factor * (2 ** attempt)
-                    logging.info("rate limit exceeded. Retrying in %s seconds...", wait_time)
-                    time.sleep(wait_time)
-                else:
-                    logging.error("raising from embedding function", e)
-                    raise  # Re-raise the exception if it's not a rate limit error
-            
-            # resp is None
-            raise RuntimeError("failed to create embedding")
-
-        raise RuntimeError("max retries exceeded. Failed to create embedding.")
-
-
 class EmbeddingModel:
     """_summary_
     """
-    def __init__(self, model_deployment: str, api_key: str, batch_size: int=100):
-        """Use API calls to embed content"""
-        self.embedding_fun = MistralEmbeddingFunction(
-                api_key=api_key,
+    def __init__(self, model_deployment: str, api_key: str, batch_size: int=100, concurrency: int=4,
+                 requests_per_second: float=5., server_url: Optional[str]=None,
+                 max_tokens: int=MAX_TOKENS_PER_REQUEST, oversize_policy: str="split",
+                 cache: Optional[EmbeddingCache]=None, backend: Optional[EmbeddingBackend]=None):
+        """Use API calls to embed content, with up to `concurrency` requests in flight, unless another `backend` is given.
+        Texts found in `cache` are not sent again."""
+        if backend is None:
+            backend = MistralBackend(
                 model_deployment=model_deployment,
+                api_key=api_key,
+                batch_size=batch_size,
+                concurrency=concurrency,
+                requests_per_second=requests_per_second,
+                server_url=server_url,
+                max_tokens=max_tokens,
+                oversize_policy=oversize_policy,
             )
+        self.backend = backend
         self.batch_size = batch_size
-
-    def embed(self, docs: List[str])-> List[float]:
+        self.cache = cache
+
+    def embed_documents(self, docs: List[str], kind: str=KIND_DOCUMENT) -> EmbeddingResult:
+        """Embeds `docs`, returning vectors aligned with them (None for rejected documents) and the reasons of rejections."""
+        hashes = [text_hash(doc) for doc in docs]
+        vectors = self.cache.get_many(self.backend.model, hashes) if self.cache else {}
+        # each distinct text missing from the cache is sent once
+        missing = list({digest: doc for digest, doc in zip(hashes, docs) if digest not in vectors}.items())
+        if vectors:
+            logging.info("%d of %d texts found in embedding cache", sum(digest in vectors for digest in hashes), len(docs))
+
+        rejected_hashes = {}
+        if missing:
+            result = self.backend.embed([doc for _, doc in missing])
+            embedded = {missing[index][0]: np.asarray(embedding, dtype=np.float32)
+                        for index, embedding in enumerate(result.vectors) if embedding is not None}
+            rejected_hashes = {missing[index][0]: reason for index, reason in result.rejected.items()}
+            if self.cache:
+                self.cache.put_many(self.backend.model, embedded, kind)
+                self.cache.commit()
+            vectors.update(embedded)
+
+        return EmbeddingResult([vectors.get(digest) for digest in hashes],
+                               {index: rejected_hashes[digest] for index, digest in enumerate(hashes) if digest in rejected_hashes})
+
+    def cached_vectors(self, text_hashes: List[str]) -> Dict[str, np.ndarray]:
+        """Vectors of the cache for `text_hashes`, without computing missing ones."""
+        return self.cache.get_many(self.backend.model, text_hashes) if self.cache else {}
+
+    def embed(self, docs: List[str])-> List[Optional[np.ndarray]]:
         """_summary_
 
         Args:
@@ -70,34 +76,4 @@ class EmbeddingModel:
         Returns:
             _type_: _description_
         """
-
-        count_batches = len(docs) // self.batch_size
-        if len(docs) % self.batch_size != 0:
-            count_batches += 1
-
-        embeddings = []
-        for batch_idx in range(count_batches):
-            idx_start = batch_idx * self.batch_size
-            idx_end = (batch_idx + 1) * self.batch_size
-            batch = docs[idx_start:idx_end]
-            try:
-                embeddings += self.embedding_fun(batch)
-            except SDKError as e:
-                if e.status_code == 400:
-                    logging.error("batch processing error: skipping ...", e)
-                else:
-                    raise  # Re-raise the exception if it's not a rate limit error
-
-            # Progress indicator
-            progress = (batch_idx + 1) / count_batches
-            bar_length = 30
-            filled_length = int(bar_length * progress)
-            progress_bar = '=' * filled_length + '-' * (bar_length - filled_length)
-
-            sys.stdout.write(f'\rProgress: [{progress_bar}] {progress:.1%} ({batch_idx + 1}/{count_batches})')
-            sys.stdout.flush()
-
-        # Print a newline after the loop completes
-        print()
-
-        return embeddings
+        return self.embed_documents(docs).vectors
@@ -0,0 +1,23 @@
+import asyncio
+from typing import List
+
+from embedding_engine import AsyncEmbeddingEngine, EmbeddingResult
+
+
+class EmbeddingBackend:
+    """Turns texts into vectors. `model` identifies the vectors produced, e.g. as key of the embedding cache."""
+    model: str
+
+    def embed(self, docs: List[str]) -> EmbeddingResult:
+        """Embeds `docs`, returning vectors aligned with them (None for rejected documents) and the reasons of rejections."""
+        raise NotImplementedError
+
+
+class MistralBackend(EmbeddingBackend):
+    """Embeddings computed by the Mistral API, see `AsyncEmbeddingEngine` for the options."""
+    def __init__(self, model_deployment: str, api_key: str, **options):
+        self.engine = AsyncEmbeddingEngine(model_deployment=model_deployment, api_key=api_key, **options)
+        self.model = model_deployment
+
+    def embed(self, docs: List[str]) -> EmbeddingResult:
+        return asyncio.run(self.engine.embed(docs))
@@ -0,0 +1,101 @@
+import hashlib
+import sqlite3
+import time
+from typing import Dict, Iterable, List, Set
+
+import numpy as np
+
+
+KIND_DOCUMENT = "document"
+KIND_QUERY = "query"
+# SQLite default limit on the number of host parameters of a statement
+MAX_PARAMETERS = 900
+
+
+def text_hash(text: str) -> str:
+    """Content address of a text, identical to the uid given to articles by generate-documents."""
+    return hashlib.md5(text.encode()).hexdigest()
+
+
+def chunked(items: List[str], size: int = MAX_PARAMETERS) -> Iterable[List[str]]:
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+class EmbeddingCache:
+    """SQLite store of embeddings keyed by model and text hash, with vectors saved as float32 blobs.
+
+    Document embeddings are kept forever. Query embeddings are evicted least recently used first,
+    beyond `max_queries` entries. A text embedded both as query and as document is kept as document.
+    """
+    def __init__(self, file_path: str, max_queries: int = 10000):
+        self.file_path = file_path
+        self.max_queries = max_queries
+        self._connection = sqlite3.connect(file_path)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        self._connection.execute("""CREATE TABLE IF NOT EXISTS embeddings (
+            model TEXT NOT NULL,
+            text_hash TEXT NOT NULL,
+            kind TEXT NOT NULL,
+            vector BLOB NOT NULL,
+            last_used REAL NOT NULL,
+            PRIMARY KEY (model, text_hash)
+        ) WITHOUT ROWID""")
+        self._connection.execute("CREATE INDEX IF NOT EXISTS embeddings_kind_last_used ON embeddings (kind, last_used)")
+        self._connection.commit()
+
+    def close(self) -> None:
+        self._connection.commit()
+        self._connection.close()
+
+    def commit(self) -> None:
+        self._connection.commit()
+
+    def count(self, kind: str = None) -> int:
+        if kind is None:
+            return self._connection.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+        return self._connection.execute("SELECT COUNT(*) FROM embeddings WHERE kind = ?", (kind,)).fetchone()[0]
+
+    def contains(self, model: str, text_hashes: List[str]) -> Set[str]:
+        """Hashes among `text_hashes` with a cached embedding, without loading vectors."""
+        found = set()
+        for chunk in chunked(text_hashes):
+            placeholders = ",".join("?" * len(chunk))
+            found.update(row[0] for row in self._connection.execute(
+                f"SELECT text_hash FROM embeddings WHERE model = ? AND text_hash IN ({placeholders})", (model, *chunk)))
+        return found
+
+    def get_many(self, model: str, text_hashes: List[str]) -> Dict[str, np.ndarray]:
+        vectors = {}
+        for chunk in chunked(text_hashes):
+            placeholders = ",".join("?" * len(chunk))
+            for text_hash, vector in self._connection.execute(
+                    f"SELECT text_hash, vector FROM embeddings WHERE model = ? AND text_hash IN ({placeholders})",
+                    (model, *chunk)):
+                vectors[text_hash] = np.frombuffer(vector, dtype=np.float32)
+
+            # recency only matters to the eviction of queries
+            self._connection.execute(
+                f"UPDATE embeddings SET last_used = ? WHERE kind = ? AND model = ? AND text_hash IN ({placeholders})",
+                (time.time(), KIND_QUERY, model, *chunk))
+        return vectors
+
+    def put_many(self, model: str, vectors: Dict[str, np.ndarray], kind: str = KIND_DOCUMENT) -> None:
+        now = time.time()
+        self._connection.executemany(
+            """INSERT INTO embeddings (model, text_hash, kind, vector, last_used) VALUES (?, ?, ?, ?, ?)
+               ON CONFLICT (model, text_hash) DO UPDATE SET kind = excluded.kind, last_used = excluded.last_used
+               WHERE excluded.kind = 'document'""",
+            [(model, text_hash, kind, np.asarray(vector, dtype=np.float32).tobytes(), now)
+             for text_hash, vector in vectors.items()])
+        if kind == KIND_QUERY:
+            self.evict_queries()
+
+    def evict_queries(self) -> int:
+        """Deletes the least recently used query embeddings beyond `max_queries`, returning how many were deleted."""
+        cursor = self._connection.execute(
+            """DELETE FROM embeddings WHERE kind = ? AND (model, text_hash) IN (
+                   SELECT model, text_hash FROM embeddings WHERE kind = ? ORDER BY last_used DESC LIMIT -1 OFFSET ?)""",
+            (KIND_QUERY, KIND_QUERY, self.max_queries))
+        return cursor.rowcount
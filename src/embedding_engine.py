@@ -0,0 +1,325 @@
+import asyncio
+import bisect
+from email.utils import parsedate_to_datetime
+import logging
+import math
+import random
+import re
+import sys
+import time
+from typing import Dict, List, NamedTuple, Optional, Union
+
+import httpx
+from mistralai import Mistral, SDKError
+
+
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+MAX_TOKENS_PER_REQUEST = 16384  # mistral-embed limit over all inputs of a request
+MAX_TOKENS_PER_INPUT = 8192  # mistral-embed context size
+BYTES_PER_TOKEN = 3  # conservative for the French, German and Italian texts of the corpus
+# refusals blamed on the length of the input, e.g. "Input id 0 has 9000 tokens, exceeding max 8192 tokens."
+TOO_LONG_ERROR = re.compile(r"exceeding max|too many tokens|too long", re.IGNORECASE)
+# texts refused for another reason are still split above this share of the input size
+NEAR_LIMIT_SHARE = 0.75
+OVERSIZE_POLICIES = ("split", "truncate", "reject")
+
+
+def estimate_tokens(text: str) -> int:
+    """Upper estimate of the number of tokens of `text`, without loading a tokenizer."""
+    return len(text.encode("utf-8")) // BYTES_PER_TOKEN + 1
+
+
+def split_text(text: str, count: int) -> List[str]:
+    """Cuts `text` into `count` parts of similar length, at whitespace when possible."""
+    parts = []
+    start = 0
+    for part in range(1, count):
+        end = len(text) * part // count
+        space = text.rfind(" ", start, end)
+        end = space if space > start else end
+        parts.append(text[start:end])
+        start = end
+    parts.append(text[start:])
+    return [part.strip() for part in parts if part.strip()]
+
+
+def combine_vectors(vectors: List[List[float]], weights: List[int]) -> List[float]:
+    """Weighted mean of the embeddings of the parts of a text, normalized like the embeddings returned by the API."""
+    if len(vectors) == 1:
+        return vectors[0]
+
+    total = [sum(weight * vector[i] for vector, weight in zip(vectors, weights)) for i in range(len(vectors[0]))]
+    norm = math.sqrt(sum(value * value for value in total)) or 1.
+    return [value / norm for value in total]
+
+
+def pack_batches(token_counts: List[int], max_tokens: int, max_count: int) -> List[List[int]]:
+    """Groups item indices into as few batches as possible, each holding at most `max_tokens` tokens and `max_count` items.
+
+    Items are placed longest first into the fullest batch that still has room for them (best-fit
+    decreasing). Items larger than `max_tokens` get a batch of their own. Indices are sorted within
+    each batch.
+    """
+    batches: List[List[int]] = []
+    # (remaining tokens, batch index) of batches that can still take items, by increasing room
+    room = []
+    for index in sorted(range(len(token_counts)), key=lambda i: token_counts[i], reverse=True):
+        tokens = token_counts[index]
+        position = bisect.bisect_left(room, (tokens, -1))
+        if position < len(room):
+            remaining, batch_index = room.pop(position)
+        else:
+            remaining, batch_index = max_tokens, len(batches)
+            batches.append([])
+
+        batches[batch_index].append(index)
+        remaining -= tokens
+        if len(batches[batch_index]) < max_count and remaining > 0:
+            bisect.insort(room, (remaining, batch_index))
+
+    for batch in batches:
+        batch.sort()
+    return batches
+
+
+def retry_after_seconds(error: SDKError) -> Optional[float]:
+    """Delay requested by the Retry-After header of a failed response, in seconds or as an HTTP date."""
+    value = error.raw_response.headers.get("retry-after") if error.raw_response is not None else None
+    if not value:
+        return None
+
+    try:
+        return max(0., float(value))
+    except ValueError:
+        pass
+
+    try:
+        return max(0., parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class AdaptiveRateLimiter:
+    """Token bucket of `burst` tokens refilled at `rate` requests per second, slowing down when the server rate limits.
+
+    Each caller reserves the time slot of its request, so that concurrent callers are spaced without
+    a lock. A 429 response divides the rate by two, blocks every caller until the end of the
+    Retry-After delay and sends callers still waiting for their slot back to the queue. Successes
+    raise the rate again by `increase` requests per second, up to `max_rate`.
+    """
+    def __init__(self, rate: float, burst: int = 1, min_rate: float = 0.1, increase: float = 0.1,
+                 decrease: float = 0.5):
+        self.max_rate = rate
+        self.rate = rate
+        self.burst = burst
+        self.min_rate = min(min_rate, rate)
+        self.increase = increase
+        self.decrease = decrease
+        self._next_slot = time.monotonic()
+        self._blocked_until = 0.
+        self._last_decrease = 0.
+        self._generation = 0
+        self.count_rate_limited = 0
+
+    def reserve(self, amount: float = 1.) -> float:
+        """Takes `amount` tokens, returning how long the caller has to wait before using them."""
+        now = time.monotonic()
+        self._next_slot = max(self._next_slot, now, self._blocked_until)
+        slot = max(now, self._blocked_until, self._next_slot - (self.burst - 1) / self.rate)
+        self._next_slot += amount / self.rate
+        return slot - now
+
+    async def acquire(self, amount: float = 1.) -> float:
+        """Waits until `amount` tokens are available, returning the time at which the request may be sent."""
+        while True:
+            generation = self._generation
+            wait = self.reserve(amount)
+            if wait > 0:
+                await asyncio.sleep(wait)
+            if generation == self._generation:
+                return time.monotonic()
+
+    def on_success(self) -> None:
+        self.rate = min(self.max_rate, self.rate + self.increase)
+
+    def on_rate_limited(self, sent_at: float, retry_after: Optional[float]) -> None:
+        """Slows down after a 429 answer to a request sent at `sent_at` (as returned by `acquire`)."""
+        now = time.monotonic()
+        self.count_rate_limited += 1
+        # requests already in flight when the rate was last reduced do not reduce it again
+        if sent_at >= self._last_decrease:
+            self.rate = max(self.min_rate, self.rate * self.decrease)
+            self._last_decrease = now
+            logging.info("rate limited: slowing down to %.2f requests/s", self.rate)
+
+        self._blocked_until = max(self._blocked_until, now + (retry_after or 1. / self.rate))
+        self._next_slot = self._blocked_until
+        self._generation += 1
+
+
+class EmbeddingResult(NamedTuple):
+    vectors: List[Optional[List[float]]]  # aligned with the documents, None for rejected documents
+    rejected: Dict[int, str]  # reason of rejection by document index
+
+
+class AsyncEmbeddingEngine:
+    """Embeds documents with up to `concurrency` requests in flight.
+
+    Documents are packed into requests of at most `batch_size` documents and `max_tokens` estimated tokens.
+    Documents longer than `max_input_tokens` are handled by `oversize_policy`: embedded in parts whose
+    vectors are averaged ("split"), cut ("truncate") or rejected ("reject"). Requests refused with a
+    400 are bisected to isolate the documents at fault, the same policy being applied to those that
+    are long enough to have been refused for their size.
+
+    Requests are paced by an `AdaptiveRateLimiter`. Rate limited requests, server errors and
+    connection failures are retried with exponential backoff and full jitter.
+    """
+    def __init__(self, model_deployment: str, api_key: str, batch_size: int = 100, concurrency: int = 4,
+                 requests_per_second: float = 5., server_url: Optional[str] = None, retries: int = 8,
+                 backoff_factor: float = 0.5, max_backoff: float = 30., timeout: float = 120.,
+                 max_tokens: int = MAX_TOKENS_PER_REQUEST, max_input_tokens: int = MAX_TOKENS_PER_INPUT,
+                 oversize_policy: str = "split"):
+        if oversize_policy not in OVERSIZE_POLICIES:
+            raise ValueError(f"unknown oversize policy {oversize_policy}, expected one of {OVERSIZE_POLICIES}")
+
+        self.model = model_deployment
+        self.api_key = api_key
+        self.batch_size = batch_size
+        self.max_tokens = max_tokens
+        self.max_input_tokens = max_input_tokens
+        self.oversize_policy = oversize_policy
+        self.concurrency = concurrency
+        self.server_url = server_url
+        self.retries = retries
+        self.backoff_factor = backoff_factor
+        self.max_backoff = max_backoff
+        self.timeout = timeout
+        self.limiter = AdaptiveRateLimiter(requests_per_second, burst=concurrency)
+
+    def backoff(self, attempt: int) -> float:
+        return random.uniform(0, min(self.max_backoff, self.backoff_factor * 2 ** attempt))
+
+    async def embed_batch(self, client: Mistral, batch: List[str]) -> List[List[float]]:
+        for attempt in range(self.retries + 1):
+            sent_at = await self.limiter.acquire()
+            try:
+                response = await client.embeddings.create_async(model=self.model, inputs=batch,
+                                                                timeout_ms=int(self.timeout * 1000))
+                self.limiter.on_success()
+                return [item.embedding for item in sorted(response.data, key=lambda item: item.index)]
+
+            except SDKError as e:
+                if e.status_code not in RETRYABLE_STATUS or attempt == self.retries:
+                    raise
+
+                if e.status_code == 429:
+                    self.limiter.on_rate_limited(sent_at, retry_after_seconds(e))
+                else:
+                    logging.warning("server error %s, retrying (attempt %d)", e.status_code, attempt + 1)
+
+            except httpx.TransportError as e:
+                if attempt == self.retries:
+                    raise
+                logging.warning("connection failed (%s), retrying (attempt %d)", e, attempt + 1)
+
+            await asyncio.sleep(self.backoff(attempt))
+
+        raise RuntimeError("max retries exceeded. Failed to create embedding.")
+
+    async def embed_bisecting(self, client: Mistral, texts: List[str]) -> List[Union[List[float], str]]:
+        """Embeds `texts`, splitting the request in two on a 400 answer, until the texts at fault are isolated.
+
+        Returns a vector, or the reason of the rejection, for each text.
+        """
+        try:
+            return await self.embed_batch(client, texts)
+        except SDKError as e:
+            if e.status_code != 400:
+                raise
+
+            if len(texts) > 1:
+                middle = len(texts) // 2
+                return await self.embed_bisecting(client, texts[:middle]) + await self.embed_bisecting(client, texts[middle:])
+
+            return [await self.embed_refused(client, texts[0], f"HTTP {e.status_code}: {e.body or e.message}")]
+
+    async def embed_refused(self, client: Mistral, text: str, reason: str) -> Union[List[float], str]:
+        """Applies the oversize policy to a text refused on its own, in case the token estimate was too low.
+
+        Texts refused for another reason than their length are rejected with it, without being split.
+        """
+        too_long = TOO_LONG_ERROR.search(reason) or estimate_tokens(text) >= NEAR_LIMIT_SHARE * self.max_input_tokens
+        if self.oversize_policy == "reject" or not too_long:
+            return reason
+
+        parts = split_text(text, 2)
+        if self.oversize_policy == "truncate":
+            parts = parts[:1]
+
+        vectors = await self.embed_bisecting(client, parts)
+        for vector in vectors:
+            if isinstance(vector, str):
+                return vector
+        return combine_vectors(vectors, [len(part) for part in parts])
+
+    async def embed(self, docs: List[str]) -> EmbeddingResult:
+        """Embeds `docs`, returning their vectors in the same order."""
+        rejected = {}
+        # (document index, text) of the inputs sent to the API
+        pieces = []
+        for index, doc in enumerate(docs):
+            tokens = estimate_tokens(doc)
+            if tokens <= self.max_input_tokens:
+                pieces.append((index, doc))
+            elif self.oversize_policy == "reject":
+                rejected[index] = f"too long: about {tokens} tokens"
+            else:
+                parts = split_text(doc, math.ceil(tokens / self.max_input_tokens))
+                if self.oversize_policy == "truncate":
+                    parts = parts[:1]
+                pieces += [(index, part) for part in parts]
+
+        batches = pack_batches([estimate_tokens(text) for _, text in pieces], self.max_tokens, self.batch_size)
+        semaphore = asyncio.Semaphore(self.concurrency)
+        results: List[Union[List[float], str, None]] = [None] * len(pieces)
+        count_done = 0
+
+        async def run(client: Mistral, batch: List[int]) -> None:
+            nonlocal count_done
+            async with semaphore:
+                vectors = await self.embed_bisecting(client, [pieces[position][1] for position in batch])
+
+            for position, vector in zip(batch, vectors):
+                results[position] = vector
+            count_done += 1
+            print_progress(count_done, len(batches))
+
+        async with Mistral(api_key=self.api_key, server_url=self.server_url) as client:
+            await asyncio.gather(*(run(client, batch) for batch in batches))
+
+        parts_by_doc: Dict[int, List[int]] = {}
+        for position, (index, _) in enumerate(pieces):
+            parts_by_doc.setdefault(index, []).append(position)
+
+        embeddings: List[Optional[List[float]]] = [None] * len(docs)
+        for index, positions in parts_by_doc.items():
+            reasons = [results[position] for position in positions if isinstance(results[position], str)]
+            if reasons:
+                rejected[index] = reasons[0]
+            else:
+                embeddings[index] = combine_vectors([results[position] for position in positions],
+                                                    [len(pieces[position][1]) for position in positions])
+
+        return EmbeddingResult(embeddings, rejected)
+
+
+def print_progress(count_done: int, count_total: int, bar_length: int = 30) -> None:
+    progress = count_done / count_total
+    filled_length = int(bar_length * progress)
+    progress_bar = '=' * filled_length + '-' * (bar_length - filled_length)
+
+    sys.stdout.write(f'\rProgress: [{progress_bar}] {progress:.1%} ({count_done}/{count_total})')
+    if count_done == count_total:
+        # newline after the completed bar
+        sys.stdout.write('\n')
+    sys.stdout.flush()
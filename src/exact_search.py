@@ -0,0 +1,89 @@
+from typing import Optional, Tuple
+
+import numpy as np
+
+
+METRICS = ("cosine", "ip", "l2")
+
+
+def top_k(scores: np.ndarray, positions: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+    """The `k` highest scores of each row and their positions, in no particular order."""
+    if scores.shape[1] <= k:
+        return scores, positions
+    best = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    return np.take_along_axis(scores, best, axis=1), np.take_along_axis(positions, best, axis=1)
+
+
+def recall(distances: np.ndarray, exact_distances: np.ndarray, tolerance: float = 1e-5) -> float:
+    """Share of the results of each query not farther than its k-th exact neighbour, up to float32 rounding,
+    so that neighbours at the same distance (e.g. identical vectors) are interchangeable."""
+    kth = exact_distances[:, -1:]
+    return float(np.mean(distances <= kth + tolerance * np.maximum(np.abs(kth), 1.)))
+
+
+class ExactSearchIndex:
+    """Exact nearest neighbours by brute force over a float32 matrix, e.g. the memory map of a vector dataset.
+
+    Rows are compared with all queries at once by blocks of `block_size` rows, keeping the best `k` of each
+    query with argpartition, so that memory does not depend on the number of rows. Distances are those of
+    Chroma for the same `metric`: 1 - cosine similarity, 1 - inner product or squared euclidean distance.
+    """
+    def __init__(self, embeddings: np.ndarray, metric: str = "cosine", block_size: int = 16384):
+        if metric not in METRICS:
+            raise ValueError(f"unknown metric {metric}, expected one of {METRICS}")
+        self.embeddings = embeddings
+        self.metric = metric
+        self.block_size = block_size
+        # inverse norms of rows (cosine) or squared norms (l2), computed by the first search
+        self._row_norms: Optional[np.ndarray] = None
+
+    def __len__(self) -> int:
+        return self.embeddings.shape[0]
+
+    def _block_scores(self, start: int, queries: np.ndarray, row_norms: np.ndarray) -> np.ndarray:
+        """Scores of rows of the block starting at `start` for each query, the higher the nearer."""
+        block = np.asarray(self.embeddings[start:start + self.block_size], dtype=np.float32)
+        products = queries @ block.T
+        if self.metric == "ip":
+            return products
+
+        if self._row_norms is None:
+            squared = np.einsum("ij,ij->i", block, block)
+            if self.metric == "cosine":
+                row_norms[start:start + len(block)] = 1. / np.maximum(np.sqrt(squared), np.finfo(np.float32).tiny)
+            else:
+                row_norms[start:start + len(block)] = squared
+        norms = row_norms[start:start + len(block)]
+        if self.metric == "cosine":
+            return products * norms
+        # squared distance up to the squared norm of the query, added back at the end
+        return 2. * products - norms
+
+    def search(self, queries: np.ndarray, k: int = 10) -> Tuple[np.ndarray, np.ndarray]:
+        """Positions of the `k` nearest rows of each query and their distances, nearest first."""
+        queries = np.atleast_2d(np.asarray(queries, dtype=np.float32))
+        query_norms = np.einsum("ij,ij->i", queries, queries)
+        if self.metric == "cosine":
+            queries = queries / np.maximum(np.sqrt(query_norms), np.finfo(np.float32).tiny)[:, None]
+        k = min(k, len(self))
+
+        row_norms = self._row_norms if self._row_norms is not None else np.empty(len(self), dtype=np.float32)
+        best_scores = np.full((len(queries), 0), -np.inf, dtype=np.float32)
+        best_positions = np.empty((len(queries), 0), dtype=np.int64)
+        for start in range(0, len(self), self.block_size):
+            scores = self._block_scores(start, queries, row_norms)
+            positions = np.broadcast_to(np.arange(start, start + scores.shape[1]), scores.shape)
+            scores, positions = top_k(scores, positions, k)
+            best_scores, best_positions = top_k(np.concatenate([best_scores, scores], axis=1),
+                                                np.concatenate([best_positions, positions], axis=1), k)
+        if self.metric != "ip":
+            self._row_norms = row_norms
+
+        order = np.argsort(-best_scores, axis=1, kind="stable")
+        best_scores = np.take_along_axis(best_scores, order, axis=1)
+        best_positions = np.take_along_axis(best_positions, order, axis=1)
+        if self.metric == "l2":
+            distances = np.maximum(query_norms[:, None] - best_scores, 0.)
+        else:
+            distances = 1. - best_scores
+        return best_positions, distances
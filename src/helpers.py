@@ -1,5 +1,16 @@
+import gzip
+import json
 import logging
+from typing import Dict, Iterator
 
 
 def setup_logging_levels():
     logging.basicConfig(level=logging.INFO, format='%(asctime)s:%(name)s:%(levelname)s:%(message)s')
+
+
+def iter_jsonl(file_path: str) -> Iterator[Dict]:
+    open_func = gzip.open if file_path.endswith('.gz') else open
+
+    with open_func(file_path, 'rt', encoding='utf-8') as f:
+        for line in f:
+            yield json.loads(line.strip())
@@ -0,0 +1,48 @@
+from concurrent.futures import ThreadPoolExecutor
+import os
+from typing import List, Optional
+
+import numpy as np
+from scipy import sparse
+from sklearn.feature_extraction.text import HashingVectorizer
+
+from embedding_backend import EmbeddingBackend
+from embedding_engine import EmbeddingResult
+
+
+class HashingEmbeddingBackend(EmbeddingBackend):
+    """Offline embeddings: hashed word unigrams and bigrams projected on `dimension` dense components.
+
+    The projection is a sparse random matrix generated from `seed`, each hashed feature being spread
+    over `density` components with random signs, which approximately preserves cosine similarities
+    between the hashed term vectors. Nothing is fitted on the corpus, so that documents and queries
+    embedded separately, by different runs, share the same space. Batches of documents are embedded
+    by `workers` threads.
+    """
+    def __init__(self, dimension: int = 1024, n_features: int = 2 ** 18, density: int = 8, seed: int = 0,
+                 batch_size: int = 1000, workers: Optional[int] = None):
+        self.dimension = dimension
+        self.batch_size = batch_size
+        self.workers = workers or os.cpu_count() or 1
+        self.model = f"local-hashing-{dimension}-{n_features}-{density}-{seed}"
+        self.vectorizer = HashingVectorizer(n_features=n_features, ngram_range=(1, 2), strip_accents="unicode",
+                                            alternate_sign=False, norm="l2", dtype=np.float32)
+        rng = np.random.default_rng(seed)
+        columns = rng.integers(0, dimension, size=(n_features, density))
+        signs = rng.choice(np.array([-1., 1.], dtype=np.float32), size=(n_features, density)) / np.sqrt(density)
+        rows = np.repeat(np.arange(n_features), density)
+        self.projection = sparse.csr_matrix((signs.ravel(), (rows, columns.ravel())), shape=(n_features, dimension),
+                                            dtype=np.float32)
+
+    def embed_batch(self, docs: List[str]) -> np.ndarray:
+        vectors = np.asarray((self.vectorizer.transform(docs) @ self.projection).todense(), dtype=np.float32)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors / np.where(norms > 0, norms, 1.)
+
+    def embed(self, docs: List[str]) -> EmbeddingResult:
+        batches = [docs[i:i + self.batch_size] for i in range(0, len(docs), self.batch_size)]
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            matrices = list(executor.map(self.embed_batch, batches))
+
+        vectors = [vector for matrix in matrices for vector in matrix]
+        return EmbeddingResult(vectors, {})
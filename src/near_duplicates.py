@@ -0,0 +1,113 @@
+import re
+import unicodedata
+from typing import Dict, List, NamedTuple, Optional, Set, Tuple
+import zlib
+
+import numpy as np
+
+
+MERSENNE_PRIME = (1 << 31) - 1
+# footnotes citing the systematic or official collections and the Federal Gazette, e.g. "RS 784.40", "AS 2006 1234"
+FOOTNOTE_REFERENCE = re.compile(r"\b(?:rs|sr|ro|as|ru|ff|bbl|fu)\s+\d+(?:[.\s]\d+)*\b")
+# footnote calls glued to the preceding word, e.g. "LRTV3"
+FOOTNOTE_CALL = re.compile(r"(?<=[^\W\d_])\d+\b")
+
+
+def normalize(text: str) -> str:
+    """Text reduced to what near-duplicates share: case, spacing and footnotes are ignored.
+
+    Other numbers, such as article numbers, amounts or time limits, are kept.
+    """
+    text = unicodedata.normalize("NFKC", text).lower()
+    text = FOOTNOTE_CALL.sub("", FOOTNOTE_REFERENCE.sub(" ", text))
+    return " ".join(text.split())
+
+
+def shingles(text: str, size: int = 3) -> Set[str]:
+    words = normalize(text).split()
+    if len(words) <= size:
+        return {" ".join(words)}
+    return {" ".join(words[i:i + size]) for i in range(len(words) - size + 1)}
+
+
+def lsh_bands(num_perm: int, threshold: float) -> Tuple[int, int]:
+    """(bands, rows) splitting signatures so that pairs above `threshold` similarity become candidates,
+    minimizing the sum of the probabilities of false positives and false negatives."""
+    similarities = np.linspace(0., 1., 1001)
+    best = None
+    for rows in range(1, num_perm + 1):
+        bands = num_perm // rows
+        candidate = 1. - (1. - similarities ** rows) ** bands
+        false_positives = candidate[similarities < threshold].mean() * threshold
+        false_negatives = (1. - candidate[similarities >= threshold]).mean() * (1. - threshold)
+        error = false_positives + false_negatives
+        if best is None or error < best[0]:
+            best = (error, bands, rows)
+    return best[1], best[2]
+
+
+class MinHasher:
+    """MinHash signatures of word shingles, with `num_perm` universal hash functions drawn from `seed`."""
+    def __init__(self, num_perm: int = 128, shingle_size: int = 3, seed: int = 1):
+        rng = np.random.default_rng(seed)
+        self.num_perm = num_perm
+        self.shingle_size = shingle_size
+        self._a = rng.integers(1, MERSENNE_PRIME, size=num_perm, dtype=np.uint64)
+        self._b = rng.integers(0, MERSENNE_PRIME, size=num_perm, dtype=np.uint64)
+
+    def signature(self, text: str) -> np.ndarray:
+        hashes = np.fromiter((zlib.crc32(shingle.encode("utf-8")) for shingle in shingles(text, self.shingle_size)),
+                             dtype=np.uint64) % np.uint64(MERSENNE_PRIME)
+        # both factors are below 2^31, so that products do not overflow
+        permuted = (self._a[:, None] * hashes[None, :] + self._b[:, None]) % np.uint64(MERSENNE_PRIME)
+        return permuted.min(axis=1).astype(np.uint32)
+
+
+class Duplicate(NamedTuple):
+    uid: str
+    representative: str
+    similarity: float
+
+
+class NearDuplicateIndex:
+    """Groups texts around the first text seen of each group of near-duplicates, its representative.
+
+    A text joins the group of a representative sharing at least one LSH band of its MinHash signature,
+    when their estimated Jaccard similarity is at least `threshold`. Texts are only compared with
+    representatives, so that groups do not drift away from them by chaining.
+    """
+    def __init__(self, threshold: float = 0.9, num_perm: int = 128, shingle_size: int = 3, seed: int = 1):
+        self.threshold = threshold
+        self.hasher = MinHasher(num_perm, shingle_size, seed)
+        self.bands, self.rows = lsh_bands(num_perm, threshold)
+        self._buckets: List[Dict[bytes, List[int]]] = [{} for _ in range(self.bands)]
+        self._representatives: List[str] = []
+        self._signatures: List[np.ndarray] = []
+
+    @property
+    def count_representatives(self) -> int:
+        return len(self._representatives)
+
+    def _band_keys(self, signature: np.ndarray) -> List[bytes]:
+        return [signature[band * self.rows:(band + 1) * self.rows].tobytes() for band in range(self.bands)]
+
+    def add(self, uid: str, text: str) -> Optional[Duplicate]:
+        """Indexes a text, returning its representative if it is a near-duplicate of an indexed text."""
+        signature = self.hasher.signature(text)
+        keys = self._band_keys(signature)
+        candidates = {position for band, key in enumerate(keys) for position in self._buckets[band].get(key, ())}
+        best = None
+        for position in candidates:
+            similarity = float(np.mean(self._signatures[position] == signature))
+            if similarity >= self.threshold and (best is None or similarity > best[1]):
+                best = (position, similarity)
+
+        if best is not None:
+            return Duplicate(uid, self._representatives[best[0]], best[1])
+
+        position = len(self._representatives)
+        self._representatives.append(uid)
+        self._signatures.append(signature)
+        for band, key in enumerate(keys):
+            self._buckets[band].setdefault(key, []).append(position)
+        return None
@@ -0,0 +1,219 @@
+"""
+Compressed vector index: vectors are kept in memory as codes, scalar (one byte per dimension) or product
+quantized (one byte per group of dimensions), which give approximate scores for a first pass. The best
+candidates are then ranked exactly against the float32 vectors, memory mapped from a vector dataset.
+
+An index folder holds
+
+- index.json: quantization method, distance function, number of rows and dimension
+- quantizer.npz: parameters of the quantizer
+- codes.npy: uint8 codes, one row per vector of the dataset
+"""
+import json
+import os
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+from sklearn.cluster import KMeans
+
+from exact_search import METRICS, ExactSearchIndex, top_k
+
+
+INDEX_FILE = "index.json"
+QUANTIZER_FILE = "quantizer.npz"
+CODES_FILE = "codes.npy"
+METHODS = ("sq", "pq")
+CENTROIDS = 256
+
+
+def normalized(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.maximum(norms, np.finfo(np.float32).tiny)
+
+
+class ScalarQuantizer:
+    """Each dimension mapped on 256 levels over its range in the training vectors: codes 4 times smaller than float32."""
+    def __init__(self, offset: Optional[np.ndarray] = None, scale: Optional[np.ndarray] = None):
+        self.offset = offset
+        self.scale = scale
+
+    def fit(self, vectors: np.ndarray) -> "ScalarQuantizer":
+        low, high = vectors.min(axis=0), vectors.max(axis=0)
+        self.offset = low.astype(np.float32)
+        self.scale = np.maximum((high - low) / (CENTROIDS - 1), np.finfo(np.float32).tiny).astype(np.float32)
+        return self
+
+    def encode(self, vectors: np.ndarray) -> np.ndarray:
+        return np.clip(np.rint((vectors - self.offset) / self.scale), 0, CENTROIDS - 1).astype(np.uint8)
+
+    def decode(self, codes: np.ndarray) -> np.ndarray:
+        return self.offset + self.scale * codes.astype(np.float32)
+
+    def products(self, queries: np.ndarray, codes: np.ndarray) -> np.ndarray:
+        """Inner products of each query with the decoded vectors, without decoding them."""
+        return (queries * self.scale) @ codes.astype(np.float32).T + (queries @ self.offset)[:, None]
+
+    def squared_norms(self, codes: np.ndarray) -> np.ndarray:
+        vectors = self.decode(codes)
+        return np.einsum("ij,ij->i", vectors, vectors)
+
+    def state(self) -> Dict[str, np.ndarray]:
+        return {"offset": self.offset, "scale": self.scale}
+
+
+class ProductQuantizer:
+    """Dimensions split in `subspaces` groups, each coded by the nearest of 256 centroids learned by k-means.
+
+    Codes take `subspaces` bytes per vector, 1024-dimension vectors being 16 times smaller than float32
+    with 256 subspaces. Inner products are sums of per-subspace tables computed once per query.
+    """
+    def __init__(self, subspaces: int = 256, centroids: Optional[np.ndarray] = None, seed: int = 0):
+        self.subspaces = subspaces
+        self.centroids = centroids
+        self.seed = seed
+
+    def _split(self, vectors: np.ndarray) -> np.ndarray:
+        """Vectors reshaped as (rows, subspaces, dimensions of a subspace)."""
+        if vectors.shape[1] % self.subspaces:
+            raise ValueError(f"dimension {vectors.shape[1]} is not a multiple of {self.subspaces} subspaces")
+        return vectors.reshape(len(vectors), self.subspaces, -1)
+
+    def fit(self, vectors: np.ndarray) -> "ProductQuantizer":
+        parts = self._split(vectors)
+        self.centroids = np.stack([
+            KMeans(n_clusters=CENTROIDS, n_init=1, max_iter=25, random_state=self.seed).fit(parts[:, j]).cluster_centers_
+            for j in range(self.subspaces)
+        ]).astype(np.float32)
+        return self
+
+    def encode(self, vectors: np.ndarray) -> np.ndarray:
+        parts = self._split(vectors)
+        codes = np.empty((len(vectors), self.subspaces), dtype=np.uint8)
+        centroid_norms = np.einsum("jkd,jkd->jk", self.centroids, self.centroids)
+        for j in range(self.subspaces):
+            distances = centroid_norms[j] - 2. * parts[:, j] @ self.centroids[j].T
+            codes[:, j] = distances.argmin(axis=1)
+        return codes
+
+    def _gather(self, tables: np.ndarray, codes: np.ndarray) -> np.ndarray:
+        """Sums over subspaces of the entries of per-subspace `tables` (rows, subspaces, centroids) selected by codes."""
+        sums = np.zeros((len(tables), len(codes)), dtype=np.float32)
+        for j in range(self.subspaces):
+            sums += tables[:, j, codes[:, j]]
+        return sums
+
+    def products(self, queries: np.ndarray, codes: np.ndarray) -> np.ndarray:
+        """Inner products of each query with the decoded vectors, from tables computed once per query."""
+        return self._gather(np.einsum("qjd,jkd->qjk", self._split(queries), self.centroids), codes)
+
+    def squared_norms(self, codes: np.ndarray) -> np.ndarray:
+        return self._gather(np.einsum("jkd,jkd->jk", self.centroids, self.centroids)[None], codes)[0]
+
+    def state(self) -> Dict[str, np.ndarray]:
+        return {"centroids": self.centroids}
+
+
+class QuantizedIndex:
+    """Search over quantized codes, the `candidates` best of each query being ranked exactly on `embeddings`.
+
+    `embeddings` is the float32 matrix the codes were computed from, e.g. the memory map of a vector dataset,
+    of which only candidate rows are read. Distances are those of ExactSearchIndex.
+    """
+    def __init__(self, quantizer, codes: np.ndarray, embeddings: np.ndarray, metric: str = "cosine",
+                 block_size: int = 4096):
+        if metric not in METRICS:
+            raise ValueError(f"unknown metric {metric}, expected one of {METRICS}")
+        if len(codes) != len(embeddings):
+            raise ValueError(f"{len(codes)} codes for {len(embeddings)} vectors")
+        self.quantizer = quantizer
+        self.codes = codes
+        self.embeddings = embeddings
+        self.metric = metric
+        self.block_size = block_size
+        # squared norms of the decoded vectors (l2), computed by the first search
+        self._squared_norms: Optional[np.ndarray] = None
+
+    @property
+    def method(self) -> str:
+        return "pq" if isinstance(self.quantizer, ProductQuantizer) else "sq"
+
+    def __len__(self) -> int:
+        return len(self.codes)
+
+    def _prepare(self, vectors: np.ndarray) -> np.ndarray:
+        vectors = np.asarray(vectors, dtype=np.float32)
+        return normalized(vectors) if self.metric == "cosine" else vectors
+
+    @classmethod
+    def build(cls, embeddings: np.ndarray, method: str = "sq", metric: str = "cosine", subspaces: int = 256,
+              train_size: int = 20000, seed: int = 0, block_size: int = 4096) -> "QuantizedIndex":
+        """Fits a quantizer on `train_size` sampled rows of `embeddings`, then encodes all rows by blocks."""
+        if method not in METHODS:
+            raise ValueError(f"unknown quantization method {method}, expected one of {METHODS}")
+        index = cls(ScalarQuantizer() if method == "sq" else ProductQuantizer(subspaces, seed=seed),
+                    np.empty((len(embeddings), 0), dtype=np.uint8), embeddings, metric, block_size)
+        sample = np.sort(np.random.default_rng(seed).choice(len(embeddings), min(train_size, len(embeddings)),
+                                                            replace=False))
+        index.quantizer.fit(index._prepare(embeddings[sample]))
+        index.codes = np.concatenate([index.quantizer.encode(index._prepare(embeddings[start:start + block_size]))
+                                      for start in range(0, len(embeddings), block_size)])
+        if method == "pq":
+            # column-major, so that the codes of a subspace are contiguous when summing tables
+            index.codes = np.asfortranarray(index.codes)
+        return index
+
+    def save(self, folder: str) -> None:
+        os.makedirs(folder, exist_ok=True)
+        np.savez(os.path.join(folder, QUANTIZER_FILE), **self.quantizer.state())
+        np.save(os.path.join(folder, CODES_FILE), self.codes)
+        with open(os.path.join(folder, INDEX_FILE), "w") as f:
+            json.dump({"method": self.method, "metric": self.metric, "count": len(self),
+                       "dimension": self.embeddings.shape[1]}, f, indent=3)
+
+    @classmethod
+    def load(cls, folder: str, embeddings: np.ndarray, block_size: int = 4096) -> "QuantizedIndex":
+        with open(os.path.join(folder, INDEX_FILE)) as f:
+            info = json.load(f)
+        with np.load(os.path.join(folder, QUANTIZER_FILE)) as state:
+            if info["method"] == "sq":
+                quantizer = ScalarQuantizer(state["offset"], state["scale"])
+            else:
+                quantizer = ProductQuantizer(len(state["centroids"]), state["centroids"])
+        return cls(quantizer, np.load(os.path.join(folder, CODES_FILE)), embeddings, info["metric"], block_size)
+
+    def _block_scores(self, start: int, queries: np.ndarray) -> np.ndarray:
+        """Approximate scores of the rows of the block starting at `start` for each query, the higher the nearer."""
+        codes = self.codes[start:start + self.block_size]
+        products = self.quantizer.products(queries, codes)
+        if self.metric != "l2":
+            return products
+        if self._squared_norms is None:
+            self._squared_norms = np.concatenate([self.quantizer.squared_norms(self.codes[position:position + self.block_size])
+                                                  for position in range(0, len(self), self.block_size)])
+        return 2. * products - self._squared_norms[start:start + len(codes)]
+
+    def search(self, queries: np.ndarray, k: int = 10, candidates: int = 100) -> Tuple[np.ndarray, np.ndarray]:
+        """Positions of the `k` nearest rows of each query and their distances, nearest first."""
+        queries = np.atleast_2d(np.asarray(queries, dtype=np.float32))
+        prepared = self._prepare(queries)
+        candidates = min(max(candidates, k), len(self))
+
+        best_scores = np.full((len(queries), 0), -np.inf, dtype=np.float32)
+        best_positions = np.empty((len(queries), 0), dtype=np.int64)
+        for start in range(0, len(self), self.block_size):
+            scores = self._block_scores(start, prepared)
+            positions = np.broadcast_to(np.arange(start, start + scores.shape[1]), scores.shape)
+            scores, positions = top_k(scores, positions, candidates)
+            best_scores, best_positions = top_k(np.concatenate([best_scores, scores], axis=1),
+                                                np.concatenate([best_positions, positions], axis=1), candidates)
+
+        k = min(k, len(self))
+        result_positions = np.empty((len(queries), k), dtype=np.int64)
+        result_distances = np.empty((len(queries), k), dtype=np.float32)
+        for row, (query, rows) in enumerate(zip(queries, best_positions)):
+            # sorted rows are read from the memory map in file order
+            rows = np.sort(rows)
+            positions, distances = ExactSearchIndex(self.embeddings[rows], self.metric).search(query, k)
+            result_positions[row] = rows[positions[0]]
+            result_distances[row] = distances[0]
+        return result_positions, result_distances
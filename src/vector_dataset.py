@@ -0,0 +1,205 @@
+"""
+Binary vectors dataset: a folder holding
+
+- embeddings.npy: float32 matrix of the embeddings, one row per record, loaded as a memory map
+- uids.txt: uid of each row, one per line
+- documents.jsonl: document text and metadata of each row, in the same order
+- offsets.npy: byte offset of each line of documents.jsonl, and its size as last entry, to read single rows
+- dataset.json: number of records and dimension
+"""
+import gzip
+import json
+import os
+import struct
+from itertools import islice
+from typing import Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+
+
+EMBEDDINGS_FILE = "embeddings.npy"
+UIDS_FILE = "uids.txt"
+DOCUMENTS_FILE = "documents.jsonl"
+OFFSETS_FILE = "offsets.npy"
+DATASET_FILE = "dataset.json"
+DTYPE = np.dtype("<f4")
+# .npy header reserved before the number of rows is known, padded with spaces as allowed by the format
+HEADER_SIZE = 128
+
+
+class VectorRecord(NamedTuple):
+    uid: str
+    embedding: np.ndarray
+    document: str
+    metadata: Dict
+
+
+def is_dataset(path: str) -> bool:
+    return os.path.isfile(os.path.join(path, DATASET_FILE))
+
+
+def npy_header(count: int, dimension: int) -> bytes:
+    header = repr({"descr": DTYPE.str, "fortran_order": False, "shape": (count, dimension)})
+    prefix = np.lib.format.magic(1, 0) + struct.pack("<H", HEADER_SIZE - 10)
+    return prefix + header.ljust(HEADER_SIZE - len(prefix) - 1).encode("latin1") + b"\n"
+
+
+class VectorDatasetWriter:
+    """Writes records to a dataset folder as they come, the number of rows being set when closing."""
+    def __init__(self, folder: str):
+        self.folder = folder
+        self.count = 0
+        self.dimension: Optional[int] = None
+        os.makedirs(folder, exist_ok=True)
+        self._embeddings = open(os.path.join(folder, EMBEDDINGS_FILE), "wb")
+        self._embeddings.write(npy_header(0, 0))
+        self._uids = open(os.path.join(folder, UIDS_FILE), "w", encoding="utf-8")
+        self._documents = open(os.path.join(folder, DOCUMENTS_FILE), "wb")
+        # sizes of the documents lines, turned into offsets when closing
+        self._line_sizes: List[np.ndarray] = []
+
+    def __enter__(self) -> "VectorDatasetWriter":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def write_many(self, uids: List[str], embeddings, documents: List[str], metadatas: List[Dict]) -> None:
+        if len(uids) == 0:
+            return
+
+        matrix = np.asarray(embeddings, dtype=DTYPE).reshape(len(uids), -1)
+        if self.dimension is None:
+            self.dimension = matrix.shape[1]
+        elif matrix.shape[1] != self.dimension:
+            raise ValueError(f"embeddings of dimension {matrix.shape[1]} written to a dataset of dimension {self.dimension}")
+
+        self._embeddings.write(np.ascontiguousarray(matrix).tobytes())
+        self._uids.writelines(uid + "\n" for uid in uids)
+        lines = [(json.dumps({"document": document, "metadata": metadata}) + "\n").encode("utf-8")
+                 for document, metadata in zip(documents, metadatas)]
+        self._documents.writelines(lines)
+        self._line_sizes.append(np.fromiter(map(len, lines), dtype=np.int64, count=len(lines)))
+        self.count += len(uids)
+
+    def write(self, uid: str, embedding, document: str, metadata: Dict) -> None:
+        self.write_many([uid], [embedding], [document], [metadata])
+
+    def close(self) -> None:
+        if self._embeddings.closed:
+            return
+
+        self._embeddings.seek(0)
+        self._embeddings.write(npy_header(self.count, self.dimension or 0))
+        for f in (self._embeddings, self._uids, self._documents):
+            f.close()
+        offsets = np.zeros(self.count + 1, dtype=np.int64)
+        if self._line_sizes:
+            np.cumsum(np.concatenate(self._line_sizes), out=offsets[1:])
+        np.save(os.path.join(self.folder, OFFSETS_FILE), offsets)
+        with open(os.path.join(self.folder, DATASET_FILE), "w") as f:
+            json.dump({"count": self.count, "dimension": self.dimension or 0, "dtype": "float32"}, f, indent=3)
+
+
+class VectorDataset:
+    """Read access to a dataset folder, the embeddings being memory mapped rather than loaded."""
+    def __init__(self, folder: str):
+        self.folder = folder
+        with open(os.path.join(folder, DATASET_FILE)) as f:
+            info = json.load(f)
+        self.count: int = info["count"]
+        self.dimension: int = info["dimension"]
+        if self.count:
+            self.embeddings: np.ndarray = np.load(os.path.join(folder, EMBEDDINGS_FILE), mmap_mode="r")
+        else:
+            self.embeddings = np.empty((0, self.dimension), dtype=DTYPE)
+        with open(os.path.join(folder, UIDS_FILE), encoding="utf-8") as f:
+            self.uids: List[str] = f.read().splitlines()
+        if len(self.uids) != self.count or self.embeddings.shape != (self.count, self.dimension):
+            raise ValueError(f"inconsistent dataset in {folder}")
+        self._positions: Optional[Dict[str, int]] = None
+
+    def __len__(self) -> int:
+        return self.count
+
+    def position(self, uid: str) -> int:
+        if self._positions is None:
+            self._positions = {uid: position for position, uid in enumerate(self.uids)}
+        return self._positions[uid]
+
+    def iter_documents(self) -> Iterator[Dict]:
+        """Document text and metadata of each row, in order."""
+        with open(os.path.join(self.folder, DOCUMENTS_FILE), encoding="utf-8") as f:
+            for line in f:
+                yield json.loads(line)
+
+    def documents_at(self, positions: Iterable[int]) -> Dict[int, Dict]:
+        """Document text and metadata of the given rows, by position, reading only those lines.
+
+        Lines are found by their offsets, or by scanning the documents of datasets written without offsets.
+        """
+        wanted = set(positions)
+        found = {}
+        offsets_path = os.path.join(self.folder, OFFSETS_FILE)
+        with open(os.path.join(self.folder, DOCUMENTS_FILE), "rb") as f:
+            if os.path.isfile(offsets_path):
+                offsets = np.load(offsets_path, mmap_mode="r")
+                for position in sorted(wanted):
+                    f.seek(int(offsets[position]))
+                    found[position] = json.loads(f.read(int(offsets[position + 1] - offsets[position])))
+                return found
+
+            for position, line in enumerate(f):
+                if position in wanted:
+                    found[position] = json.loads(line)
+                    if len(found) == len(wanted):
+                        break
+        return found
+
+    def __iter__(self) -> Iterator[VectorRecord]:
+        for position, entry in enumerate(self.iter_documents()):
+            yield VectorRecord(self.uids[position], self.embeddings[position], entry["document"], entry["metadata"])
+
+
+def iter_jsonl_records(file_path: str) -> Iterator[VectorRecord]:
+    """Records of a vectors jsonl file, as written by generate-vectors (may be gzipped)."""
+    open_func = gzip.open if file_path.endswith(".gz") else open
+    with open_func(file_path, "rt", encoding="utf-8") as f:
+        for line in f:
+            entry = json.loads(line)
+            yield VectorRecord(entry["uid"], entry["embedding"], entry["document"], entry["metadata"])
+
+
+def iter_records(path: str) -> Iterator[VectorRecord]:
+    """Records of a dataset folder or of a vectors jsonl file."""
+    return iter(VectorDataset(path)) if is_dataset(path) else iter_jsonl_records(path)
+
+
+def iter_batches(path: str, batch_size: int) -> Iterator[Tuple[List[str], List, List[str], List[Dict]]]:
+    """(ids, embeddings, documents, metadatas) of consecutive records of a dataset folder or of a vectors jsonl file.
+
+    Embeddings of a dataset are rows of its memory map, the matrix being read in slices without any conversion.
+    """
+    if is_dataset(path):
+        dataset = VectorDataset(path)
+        documents = dataset.iter_documents()
+        for start in range(0, dataset.count, batch_size):
+            end = min(start + batch_size, dataset.count)
+            entries = list(islice(documents, end - start))
+            yield (dataset.uids[start:end], list(dataset.embeddings[start:end]),
+                   [entry["document"] for entry in entries], [entry["metadata"] for entry in entries])
+        return
+
+    records = iter_jsonl_records(path)
+    while True:
+        batch = list(islice(records, batch_size))
+        if not batch:
+            return
+        yield ([record.uid for record in batch], [record.embedding for record in batch],
+               [record.document for record in batch], [record.metadata for record in batch])
+
+
+def jsonl_line(record: VectorRecord) -> str:
+    embedding = record.embedding.tolist() if isinstance(record.embedding, np.ndarray) else record.embedding
+    return json.dumps({"uid": record.uid, "embedding": embedding, "document": record.document,
+                       "metadata": record.metadata}) + "\n"
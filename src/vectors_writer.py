@@ -0,0 +1,92 @@
+import json
+import logging
+import os
+from typing import Dict, Set
+
+
+# lines are written by json.dumps with the uid first
+UID_PREFIX = '{"uid": "'
+
+
+def read_uid(line: str) -> str:
+    """Uid of a line of the vectors file, without decoding its embedding."""
+    if line.startswith(UID_PREFIX):
+        return line[len(UID_PREFIX):line.index('"', len(UID_PREFIX))]
+    return json.loads(line)["uid"]
+
+
+class VectorsWriter:
+    """Appends rows to a vectors jsonl file through a single buffered handle, resuming after a crash.
+
+    Opening the file repairs it: a last line torn by a crash mid-write is dropped, the uids of
+    the complete lines being returned so that their documents are skipped. Rows reach the disk
+    at checkpoints, every `checkpoint_every` rows, and when closing.
+    """
+    def __init__(self, file_path: str, checkpoint_every: int = 5000, buffer_size: int = 1024 * 1024):
+        self.file_path = file_path
+        self.checkpoint_every = checkpoint_every
+        self.buffer_size = buffer_size
+        self.count_written = 0
+        self._count_pending = 0
+        self._file = None
+
+    def __enter__(self) -> "VectorsWriter":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def repair(self) -> Set[str]:
+        """Truncates a torn last line, returning the uids of the lines already written."""
+        uids = set()
+        valid_size = 0
+        if not os.path.exists(self.file_path):
+            return uids
+
+        with open(self.file_path, "rb") as f:
+            last_line = None
+            for line in f:
+                if last_line is not None:
+                    uids.add(read_uid(last_line.decode("utf-8")))
+                    valid_size += len(last_line)
+                last_line = line
+
+        if last_line is not None:
+            try:
+                if not last_line.endswith(b"\n"):
+                    raise ValueError("incomplete row")
+                uids.add(json.loads(last_line)["uid"])
+                valid_size += len(last_line)
+            except (ValueError, KeyError):
+                logging.warning("dropping truncated row at offset %d in %s", valid_size, self.file_path)
+
+        if valid_size < os.path.getsize(self.file_path):
+            with open(self.file_path, "r+b") as f:
+                f.truncate(valid_size)
+
+        return uids
+
+    def open(self) -> Set[str]:
+        """Opens the file for appending after repairing it, returning the uids already stored."""
+        uids = self.repair()
+        self._file = open(self.file_path, "a", encoding="utf-8", buffering=self.buffer_size)
+        return uids
+
+    def write(self, row: Dict) -> None:
+        self._file.write(json.dumps(row) + "\n")
+        self.count_written += 1
+        self._count_pending += 1
+        if self._count_pending >= self.checkpoint_every:
+            self.checkpoint()
+
+    def checkpoint(self) -> None:
+        """Makes rows written so far durable."""
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._count_pending = 0
+
+    def close(self) -> None:
+        if self._file is not None:
+            self.checkpoint()
+            self._file.close()
+            self._file = None
@@ -0,0 +1,94 @@
+import datetime
+import logging
+from typing import Optional, Tuple
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+
+
+SPARQL_ENDPOINT = "https://fedlex.data.admin.ch/sparqlendpoint"
+DATA_HOST = "https://fedlex.data.admin.ch"
+LANGUAGES = {
+    "de": "DEU",
+    "fr": "FRA",
+    "it": "ITA",
+    "rm": "ROH",
+    "en": "ENG",
+}
+VERSIONS_QUERY = """
+PREFIX jolux: <http://data.legilux.public.lu/resource/ontology/jolux#>
+SELECT ?dateApplicability ?dateEndApplicability ?fileUrl WHERE {{
+    ?consolidation jolux:isMemberOf <{work}> ;
+                   jolux:dateApplicability ?dateApplicability ;
+                   jolux:isRealizedBy ?expression .
+    OPTIONAL {{ ?consolidation jolux:dateEndApplicability ?dateEndApplicability . }}
+    ?expression jolux:language <http://publications.europa.eu/resource/authority/language/{language}> ;
+                jolux:isEmbodiedBy ?manifestation .
+    ?manifestation jolux:userFormat <https://fedlex.data.admin.ch/vocabulary/user-format/xml> ;
+                   jolux:isExemplifiedBy ?fileUrl .
+}}
+"""
+
+
+class XmlUrlResolver:
+    """Finds the XML file of the version in force of a law without rendering its page.
+
+    The consolidated versions of the ELI work are listed from the Fedlex SPARQL endpoint
+    over a pooled keep-alive session, and the one applicable at the given date is selected,
+    which is the version flagged in green on the law page.
+    """
+    def __init__(self, endpoint: str = SPARQL_ENDPOINT, timeout: float = 30, pool_size: int = 10):
+        self.endpoint = endpoint
+        self.timeout = timeout
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def close(self) -> None:
+        self.session.close()
+
+    @staticmethod
+    def parse_page_url(page_url: str) -> Optional[Tuple[str, str]]:
+        """Splits a law page URL such as https://www.fedlex.admin.ch/eli/cc/27/317_321_377/fr
+        into its ELI work URI and its language code."""
+        parts = urlparse(page_url).path.strip("/").split("/")
+        if len(parts) < 3 or parts[0] != "eli" or parts[-1] not in LANGUAGES:
+            return None
+
+        return "/".join([DATA_HOST] + parts[:-1]), LANGUAGES[parts[-1]]
+
+    def resolve(self, page_url: str, on_date: Optional[datetime.date] = None) -> Optional[str]:
+        """Returns the URL of the XML file applicable at `on_date` (today by default), or None if not found.
+
+        Raises:
+            requests.RequestException: the endpoint could not be queried
+        """
+        parsed = self.parse_page_url(page_url)
+        if parsed is None:
+            logging.warning("not an ELI law url: %s", page_url)
+            return None
+
+        work, language = parsed
+        response = self.session.get(self.endpoint,
+                                    params={"query": VERSIONS_QUERY.format(work=work, language=language)},
+                                    headers={"Accept": "application/sparql-results+json"},
+                                    timeout=self.timeout)
+        response.raise_for_status()
+
+        day = (on_date or datetime.date.today()).isoformat()
+        versions = []
+        for binding in response.json()["results"]["bindings"]:
+            date_start = binding["dateApplicability"]["value"][:10]
+            date_end = binding.get("dateEndApplicability", {}).get("value", "9999-12-31")[:10]
+            if date_start <= day <= date_end:
+                versions.append((date_start, binding["fileUrl"]["value"]))
+
+        if not versions:
+            logging.info("no version in force found for %s", page_url)
+            return None
+
+        xml_url = max(versions)[1]
+        logging.info(f"resolved XML URL: {xml_url}")
+        return xml_url
@@ -0,0 +1,83 @@
+import asyncio
+import contextlib
+import http.server
+import io
+import threading
+import unittest
+
+from embedding_engine import AsyncEmbeddingEngine, estimate_tokens, pack_batches
+from stand_in_embedding_server import EmbeddingsHandler, RateLimit, stand_in_vector
+
+
+DIMENSION = 8
+REJECT_MARKER = "@reject@"
+
+
+class StandInEmbeddingServerTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), EmbeddingsHandler)
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.server_url = f"http://127.0.0.1:{cls.server.server_port}"
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+        EmbeddingsHandler.dimension = DIMENSION
+        EmbeddingsHandler.latency = 0.
+        EmbeddingsHandler.reject_marker = None
+        EmbeddingsHandler.rate_limit = None
+        EmbeddingsHandler.count_requests = 0
+        EmbeddingsHandler.count_rate_limited = 0
+
+    def embed(self, docs, **options):
+        engine = AsyncEmbeddingEngine("mistral-embed", "test-key", server_url=self.server_url, backoff_factor=0.01,
+                                      **options)
+        # the progress bar is written to stdout
+        with contextlib.redirect_stdout(io.StringIO()):
+            return asyncio.run(engine.embed(docs))
+
+    def assertStandInVectors(self, docs, vectors):
+        for doc, vector in zip(docs, vectors):
+            self.assertEqual(len(vector), DIMENSION)
+            for value, expected in zip(vector, stand_in_vector(doc, DIMENSION)):
+                self.assertAlmostEqual(value, expected, places=6)
+
+    def test_retry_after_rate_limit(self):
+        EmbeddingsHandler.rate_limit = RateLimit(1)
+        docs = ["premier article", "second article", "troisième article"]
+        result = self.embed(docs, batch_size=1, concurrency=1, requests_per_second=100.)
+
+        self.assertGreater(EmbeddingsHandler.count_rate_limited, 0)
+        self.assertEqual(result.rejected, {})
+        self.assertStandInVectors(docs, result.vectors)
+
+    def test_vectors_in_input_order(self):
+        docs = [f"article {index} " + "texte " * (index * 7 % 23) for index in range(20)]
+        batches = pack_batches([estimate_tokens(doc) for doc in docs], 40, 3)
+        # packing longest first must have put documents out of their original order
+        self.assertNotEqual([index for batch in batches for index in batch], list(range(len(docs))))
+
+        result = self.embed(docs, batch_size=3, max_tokens=40, requests_per_second=100.)
+        self.assertEqual(result.rejected, {})
+        self.assertStandInVectors(docs, result.vectors)
+
+    def test_bisection_isolates_refused_input(self):
+        EmbeddingsHandler.reject_marker = REJECT_MARKER
+        docs = [f"article {index}" for index in range(8)]
+        docs[5] = f"article {REJECT_MARKER}"
+        result = self.embed(docs, batch_size=8, requests_per_second=100.)
+
+        self.assertEqual(list(result.rejected), [5])
+        self.assertIn("HTTP 400", result.rejected[5])
+        self.assertIn("is invalid", result.rejected[5])
+        self.assertIsNone(result.vectors[5])
+        self.assertStandInVectors(docs[:5] + docs[6:], result.vectors[:5] + result.vectors[6:])
+
+
+if __name__ == "__main__":
+    unittest.main()
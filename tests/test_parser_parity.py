@@ -0,0 +1,31 @@
+import glob
+import logging
+import os
+import unittest
+
+from generate_documents import load_articles, lxml_etree
+
+
+RESOURCES = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "resources")
+
+
+@unittest.skipIf(lxml_etree is None, "lxml is not installed")
+class ParserParityTest(unittest.TestCase):
+
+    def setUp(self):
+        # extraction logs every document
+        logging.disable(logging.INFO)
+        self.addCleanup(logging.disable, logging.NOTSET)
+
+    def test_same_records_on_sample_documents(self):
+        documents = sorted(glob.glob(os.path.join(RESOURCES, "fedlex-*.xml")))
+        self.assertTrue(documents, f"no sample document found in {RESOURCES}")
+        for document in documents:
+            with self.subTest(document=os.path.basename(document)):
+                records = load_articles(document, "etree")
+                self.assertTrue(records)
+                self.assertEqual(records, load_articles(document, "lxml"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,85 @@
+import datetime
+import http.server
+import json
+import threading
+import unittest
+from urllib.parse import parse_qs, urlparse
+
+from xml_resolver import XmlUrlResolver
+
+
+PAGE_URL = "https://www.fedlex.admin.ch/eli/cc/27/317_321_377/fr"
+FILE_URL = "https://fedlex.data.admin.ch/filestore/fedlex.data.admin.ch/eli/cc/27/317_321_377/{}/fr/xml/fedlex-{}.xml"
+
+
+def binding(date_start: str, date_end: str = None) -> dict:
+    entry = {
+        "dateApplicability": {"type": "literal", "value": date_start},
+        "fileUrl": {"type": "uri", "value": FILE_URL.format(date_start.replace("-", ""), date_start)},
+    }
+    if date_end:
+        entry["dateEndApplicability"] = {"type": "literal", "value": date_end}
+    return entry
+
+
+# versions of the work in French: an old one, the one in force and a future one
+BINDINGS = {
+    "FRA": [binding("2020-01-01", "2023-12-31"), binding("2024-01-01"), binding("2030-01-01")],
+}
+
+
+class SparqlHandler(http.server.BaseHTTPRequestHandler):
+    queries = []
+
+    def do_GET(self):
+        query = parse_qs(urlparse(self.path).query)["query"][0]
+        self.queries.append(query)
+        language = next((code for code in BINDINGS if f"/language/{code}>" in query), None)
+        body = json.dumps({
+            "head": {"vars": ["dateApplicability", "dateEndApplicability", "fileUrl"]},
+            "results": {"bindings": BINDINGS.get(language, [])},
+        }).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/sparql-results+json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class XmlUrlResolverTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), SparqlHandler)
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.resolver = XmlUrlResolver(f"http://127.0.0.1:{cls.server.server_port}/sparqlendpoint")
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.resolver.close()
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def test_version_in_force(self):
+        xml_url = self.resolver.resolve(PAGE_URL, datetime.date(2025, 6, 1))
+        self.assertEqual(xml_url, FILE_URL.format("20240101", "2024-01-01"))
+        self.assertIn("<https://fedlex.data.admin.ch/eli/cc/27/317_321_377>", SparqlHandler.queries[-1])
+
+    def test_future_version(self):
+        self.assertEqual(self.resolver.resolve(PAGE_URL, datetime.date(2031, 1, 1)),
+                         FILE_URL.format("20300101", "2030-01-01"))
+        self.assertEqual(self.resolver.resolve(PAGE_URL, datetime.date(2022, 1, 1)),
+                         FILE_URL.format("20200101", "2020-01-01"))
+
+    def test_no_version_in_language(self):
+        self.assertIsNone(self.resolver.resolve(PAGE_URL[:-2] + "de", datetime.date(2025, 6, 1)))
+
+    def test_no_version_in_force(self):
+        self.assertIsNone(self.resolver.resolve(PAGE_URL, datetime.date(2019, 1, 1)))
+
+
+if __name__ == "__main__":
+    unittest.main()